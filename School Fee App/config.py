@@ -10,5 +10,34 @@ class Config:
         f"sqlite:///{BASE_DIR / 'instance' / 'app.db'}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # applied on every new SQLite connection (preschool/dbtune.py); empty to keep SQLite's defaults
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 15000)),
+        "cache_size": -32000,          # KiB, i.e. 32 MB per connection
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    }
+    # one connection per worker thread; more threads than this wait up to pool_timeout seconds
+    # (an in-memory database uses a single shared connection and takes no pool options)
+    SQLALCHEMY_ENGINE_OPTIONS = {} if SQLALCHEMY_DATABASE_URI in ("sqlite://", "sqlite:///:memory:") else {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": 30,
+    }
     UPLOAD_FOLDER = str(BASE_DIR / "uploads")
     BACKUP_FOLDER = str(BASE_DIR / "backups")
+    BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", 14))                       # zips kept; 0 keeps all
+    BACKUP_INTERVAL_HOURS = float(os.environ.get("BACKUP_INTERVAL_HOURS", 24))  # 0 disables the schedule
+    BACKUP_PAGES = 1024   # pages copied per backup step; writers wait at most one step
+    BACKUP_MAX_RESTARTS = 3   # restarts caused by writers before the rest is copied in one step
+    # incremental backups: log row changes and save them this often; 0 turns the change log off
+    BACKUP_CHANGES_MINUTES = float(os.environ.get("BACKUP_CHANGES_MINUTES", 0))
+    # raise instead of logging when a view goes over its @query_budget (always on under testing)
+    QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT") == "1"
+    # /admin/perf: requests and slow statements kept in memory, and what counts as slow
+    PERF_RECENT_REQUESTS = int(os.environ.get("PERF_RECENT_REQUESTS", 500))
+    PERF_SLOW_QUERIES = int(os.environ.get("PERF_SLOW_QUERIES", 100))
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+    DASHBOARD_CACHE_TTL = int(os.environ.get("DASHBOARD_CACHE_TTL", 30))  # seconds
@@ -13,7 +13,13 @@ from .admin import admin_bp
 from .refunds import refunds_bp
 from .settings import settings_bp
 from .dbfix import ensure_schema
-from .utils import ensure_default_dirs, school_name, next_receipt_no
+from .ledger import ledger_cli, rebuild_balances
+from .rollups import rollups_cli, ensure_rollups
+from .settlements import settlements_cli
+from .backups import backup_cli, init_backups
+from .utils import ensure_default_dirs, school_name, peek_receipt_no
+from .instrument import init_instrumentation
+from .dbtune import init_sqlite
 
 def create_app():
     # MODIFIED: Changed how the Flask app is created to be more explicit.
@@ -27,12 +33,20 @@ def create_app():
 
     ensure_default_dirs(app)
     db.init_app(app)
+    init_sqlite(app)
     login_manager.init_app(app)
+    init_instrumentation(app)
+    init_backups(app)
 
     with app.app_context():
         from .models import User
         db.create_all()
-        ensure_schema(db)
+        added = ensure_schema(db)
+        if "student.opening_balance" in added:
+            # first start after the ledger columns appeared: derive balances once
+            rebuild_balances()
+            db.session.commit()
+        ensure_rollups()
         # seed default owner
         if not User.query.filter_by(username="owner").first():
             u = User(username="owner", full_name="Owner", role="Owner")
@@ -44,7 +58,13 @@ def create_app():
     @app.context_processor
     def inject_helpers():
         from .utils import now
-        return dict(now=now, school_name=school_name, receipt_next_number=next_receipt_no)
+        # peek only: allocating here would burn a number on every render
+        return dict(now=now, school_name=school_name, receipt_next_number=peek_receipt_no)
+
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(settlements_cli)
+    app.cli.add_command(backup_cli)
 
     # Blueprints
     app.register_blueprint(auth_bp)
@@ -60,23 +80,13 @@ def create_app():
     @app.route("/")
     @login_required
     def index():
-        from .models import Student, StudentFee, Receipt
-        from .utils import D
-        from sqlalchemy import func
-        
-        receivable = db.session.query(func.sum(StudentFee.amount)).scalar() or D(0)
-        received = db.session.query(func.coalesce(func.sum(Receipt.amount), 0)).scalar() or D(0)
-        balance = receivable - received
-        
-        top = [(s, s.balance()) for s in Student.query.all() if s.balance() > 0]
-        top.sort(key=lambda x: x[1], reverse=True)
-        top = top[:10]
-        
+        from .dashboard import dashboard_snapshot
+        snap = dashboard_snapshot()
         return render_template("dashboard.html",
-                               receivable=receivable,
-                               received=received,
-                               balance=balance,
-                               top_overdue=top)
+                               receivable=snap['receivable'],
+                               received=snap['received'],
+                               balance=snap['balance'],
+                               top_overdue=snap['top_overdue'])
 
     @app.route("/healthz")
     def healthz():
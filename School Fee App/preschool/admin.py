@@ -1,10 +1,11 @@
 # preschool/admin.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import current_user
 from .extensions import db
 from .models import User, AuditLog
 from .security import role_required, audit
-from .utils import backup_sqlite
+from .backups import start_backup
+from .instrument import perf_snapshot, reset_perf
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -33,10 +34,23 @@ def audit_log():
 @admin_bp.route('/backup')
 @role_required(['Owner'])
 def backup():
-    path = backup_sqlite()
-    if "Error" in path:
-        flash(path, 'danger')
+    if start_backup(current_app._get_current_object()):
+        flash('Backup started', 'success')
     else:
-        flash(f'Backup created at {path}', 'success')
+        flash('A backup is already running', 'info')
     # MODIFIED: Redirect to settings page for better UX
-    return redirect(url_for('settings.index'))
\ No newline at end of file
+    return redirect(url_for('settings.index'))
+
+@admin_bp.route('/perf', methods=['GET', 'POST'])
+@role_required(['Owner'])
+def perf():
+    if request.method == 'POST':
+        reset_perf()
+        flash('Performance counters cleared', 'success'); return redirect(url_for('admin.perf'))
+    snap = perf_snapshot()
+    return render_template('admin/perf.html', snap=snap, recent=snap['recent'][:100])
+
+@admin_bp.route('/perf.json')
+@role_required(['Owner'])
+def perf_json():
+    return jsonify(perf_snapshot())
@@ -0,0 +1,120 @@
+# preschool/aging.py
+"""
+Receivables aging.
+
+Payments are allocated to charges oldest first (FIFO) for every student at
+once: two queries load the charges and each student's credits, and the
+allocation is a grouped running total in pandas, so the cost does not grow
+with a per-student loop.
+
+    charges = opening balance + student_fee rows
+    credits = opening credit + receipts + approved waivers - refunds
+
+A charge is still open by min(amount, max(0, running total - credits)); its
+age is as_of minus its due date. Fees without a due date, and the opening
+balance, are dated from the student's creation. Charges due after as_of are
+reported as "not due" and never count as overdue, matching overdue_query().
+Amounts are handled as integer paise so totals stay exact.
+"""
+from sqlalchemy import func, select, cast, Integer
+from .extensions import db
+from .models import Student, StudentFee
+from .balances import balance_query
+from .utils import D
+
+BUCKETS = (
+    ('d0_30', '0–30 days', 0, 30),
+    ('d31_60', '31–60 days', 31, 60),
+    ('d61_90', '61–90 days', 61, 90),
+    ('d90_plus', '90+ days', 91, None),
+)
+COLUMNS = ['not_due'] + [key for key, *_ in BUCKETS] + ['overdue']
+STUDENT_COLUMNS = ['student_id', 'admission_no', 'name', 'class_name', 'section', 'phone']
+
+# Amounts and ages are computed in SQL as plain integers, so no Decimal/date
+# conversion happens per row on the Python side. The frames are cast to
+# explicit dtypes because an empty result comes back as object columns.
+
+def _paise(expr):
+    return cast(func.round(func.coalesce(expr, 0) * 100), Integer)
+
+def _age(as_of, day):
+    """Whole days from `day` to as_of (negative = not yet due)."""
+    return cast(func.julianday(as_of.isoformat()) - func.julianday(day), Integer)
+
+def _frame(stmt, columns):
+    # read_sql on the session's connection skips the ORM row objects
+    import pandas as pd
+    return pd.read_sql(stmt, db.session.connection()).set_axis(columns, axis=1)
+
+def _students(criteria, as_of):
+    """Per-student identity columns, opening balance age, opening and credits (paise)."""
+    since = func.date(Student.created_at)
+    ledger = balance_query(*criteria, entities=(
+        Student.id.label('student_id'), Student.admission_no, Student.name, Student.class_name,
+        Student.section, Student.phone, _age(as_of, since).label('age'))).subquery()
+    c = ledger.c
+    frame = _frame(
+        select(*(c[col] for col in STUDENT_COLUMNS), c.age, _paise(c.opening),
+               _paise(c.received) + _paise(c.waived) - _paise(c.refunded)),
+        STUDENT_COLUMNS + ['age', 'opening', 'credits'],
+    ).astype({'student_id': 'int64', 'age': 'float64', 'opening': 'int64', 'credits': 'int64'})
+    # a negative opening (net opening credit) is a credit, not a charge
+    frame['credits'] -= frame['opening'].clip(upper=0)
+    return frame
+
+def _charges(students, criteria, as_of):
+    """(student_id, age, amount, order) for every charge, oldest first per student."""
+    import pandas as pd
+    fees = _frame(
+        select(StudentFee.student_id,
+               _age(as_of, func.coalesce(StudentFee.due_date, func.date(Student.created_at))),
+               _paise(StudentFee.amount))
+        .join(Student, Student.id == StudentFee.student_id).where(*criteria),
+        ['student_id', 'age', 'amount'],
+    ).astype({'student_id': 'int64', 'age': 'float64', 'amount': 'int64'}).assign(order=1)
+    opening = (students.loc[students['opening'] > 0, ['student_id', 'age', 'opening']]
+               .rename(columns={'opening': 'amount'}).assign(order=0))
+    charges = pd.concat([opening, fees], ignore_index=True)
+    # the opening balance first, then the oldest due date (largest age); undated first
+    return charges.sort_values(['student_id', 'order', 'age'], ascending=[True, True, False],
+                               kind='stable', na_position='first')
+
+def aging_frame(*criteria, as_of):
+    """DataFrame with one row per student that has anything open.
+
+    Columns: student_id, admission_no, name, class_name, section, phone,
+    not_due, d0_30, d31_60, d61_90, d90_plus, overdue (amounts in rupees).
+    """
+    import pandas as pd
+    students = _students(criteria, as_of)
+    charges = _charges(students, criteria, as_of)
+
+    credits = charges['student_id'].map(students.set_index('student_id')['credits']).fillna(0)
+    running = charges.groupby('student_id', sort=False)['amount'].cumsum()
+    charges['open'] = (running - credits).clip(lower=0).clip(upper=charges['amount'])
+    charges = charges[charges['open'] > 0]
+
+    age = charges['age'].fillna(BUCKETS[-1][2])
+    bucket = pd.Series('not_due', index=charges.index)
+    for key, _, lo, hi in BUCKETS:
+        bucket[(age >= lo) & ((age <= hi) if hi is not None else True)] = key
+    charges = charges.assign(bucket=bucket)
+
+    table = (charges.pivot_table(index='student_id', columns='bucket', values='open',
+                                 aggfunc='sum', fill_value=0)
+             .reindex(columns=COLUMNS[:-1], fill_value=0))
+    table['overdue'] = table[[key for key, *_ in BUCKETS]].sum(axis=1)
+    table = table / 100
+    out = students[STUDENT_COLUMNS].merge(table, left_on='student_id', right_index=True)
+    return out.sort_values(['overdue', 'name'], ascending=[False, True], ignore_index=True)
+
+def aging_by_class(frame):
+    """Bucket totals per (class, section), plus a student count."""
+    grouped = frame.fillna({'class_name': '', 'section': ''}).groupby(['class_name', 'section'])
+    out = grouped[COLUMNS].sum()
+    out['students'] = grouped.size()
+    return out.reset_index().sort_values(['class_name', 'section'], ignore_index=True)
+
+def aging_totals(frame):
+    return {col: D(str(frame[col].sum())).quantize(D('0.01')) for col in COLUMNS}
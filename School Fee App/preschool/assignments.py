@@ -0,0 +1,61 @@
+# preschool/assignments.py
+"""
+Bulk fee assignment.
+
+assign_fee() charges a fee type to a whole cohort (class, section, a list of
+students, or everyone active) with two set-based statements in the caller's
+transaction: one UPDATE moving the persisted balances and one
+INSERT ... SELECT creating the StudentFee rows. An assignment is identified
+by its fee type and due date: students that already have that charge are
+left alone, so re-running an assignment is harmless, while the same fee type
+for another term (another due date) is a new charge. Fee plan installments
+never count as an earlier assignment.
+"""
+from sqlalchemy import select, insert, exists, literal, func
+from .extensions import db
+from .models import Student, StudentFee
+from .ledger import post_where
+
+def cohort(class_name=None, section=None, student_ids=None, active_only=True):
+    """Criteria on Student for the selected cohort (all given filters apply)."""
+    criteria = []
+    if active_only:
+        criteria.append(Student.discontinued.is_(None))
+    if class_name:
+        criteria.append(Student.class_name == class_name)
+    if section:
+        criteria.append(Student.section == section)
+    if student_ids is not None:
+        criteria.append(Student.id.in_(student_ids))
+    return criteria
+
+def _missing(fee_type_id, due_date=None):
+    """Students without this assignment (fee type, due date) yet."""
+    due = StudentFee.due_date.is_(None) if due_date is None else StudentFee.due_date == due_date
+    return ~exists().where(StudentFee.student_id == Student.id, StudentFee.fee_type_id == fee_type_id,
+                           StudentFee.installment_id.is_(None), due)
+
+def preview(fee_type_id, *criteria, due_date=None):
+    """(students in cohort, students that would be charged)."""
+    row = db.session.query(
+        func.count(Student.id),
+        func.coalesce(func.sum(db.case((_missing(fee_type_id, due_date), 1), else_=0)), 0),
+    ).filter(*criteria).one()
+    return int(row[0]), int(row[1])
+
+def assign_fee(fee_type_id, amount, *criteria, due_date=None):
+    """Create StudentFee(fee_type_id, amount, due_date) for every student in the
+    cohort that doesn't have it yet, and post the charge to their balances.
+    Caller commits.
+
+    Returns the number of students charged.
+    """
+    targets = (*criteria, _missing(fee_type_id, due_date))
+    # balances first: the NOT EXISTS still sees the pre-insert state
+    post_where(amount, *targets)
+    result = db.session.execute(insert(StudentFee).from_select(
+        ['student_id', 'fee_type_id', 'amount', 'due_date'],
+        select(Student.id, literal(fee_type_id), literal(amount, StudentFee.amount.type),
+               literal(due_date, StudentFee.due_date.type)).where(*targets),
+    ))
+    return result.rowcount
@@ -0,0 +1,506 @@
+# preschool/backups.py
+"""
+Online SQLite backups.
+
+A backup is taken with SQLite's online backup API, BACKUP_PAGES pages per
+step, so the copy is a consistent snapshot and writers are only held up for
+one short step at a time. A write from another connection makes SQLite
+restart the copy; after BACKUP_MAX_RESTARTS restarts the rest is copied in
+a single step instead, so a busy database cannot keep a backup from ever
+finishing. The snapshot is then zipped (same backup-YYYYmmdd-HHMMSS.zip
+layout as before) and the oldest zips beyond BACKUP_KEEP are deleted.
+
+Backups started from the web UI run on a background thread; the request
+only queues the job. One job runs at a time per process, and a lock file in
+BACKUP_FOLDER keeps several processes from backing up at once. With
+BACKUP_INTERVAL_HOURS set, a scheduler thread (started by the first
+request, so CLI commands never spawn it) takes a backup whenever the newest
+zip is older than the interval.
+
+Incremental backups (BACKUP_CHANGES_MINUTES > 0) come from change_log, a
+table fed by AFTER INSERT/UPDATE/DELETE triggers on every model table: each
+row change is stored as (seq, at, table, op, primary key, row as JSON).
+export_changes() moves the rows logged since the last export into a small
+changes-<stamp>-<first seq>-<last seq>.jsonl.gz and deletes them from the
+table, so a run every few minutes costs only what changed. Every full backup
+records the change_log position its snapshot contains (backup.json inside
+the zip), and restore_backup() unpacks the newest full backup taken before
+the target time and replays the later changes up to that time into a new
+file. The live database is never touched by a restore.
+"""
+import glob
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from .extensions import db
+
+backup_cli = AppGroup('backup', help='Database backups.')
+
+PATTERN = 'backup-*.zip'
+CHANGES_PATTERN = 'changes-*.jsonl.gz'
+META_NAME = 'backup.json'
+LOCK_NAME = '.backup.lock'
+LOCK_STALE = 6 * 3600    # a lock file older than this is from a crashed run
+
+_job = {'state': 'idle'}
+_job_lock = threading.Lock()
+_scheduler = None
+
+class BackupError(Exception):
+    pass
+
+class _Restarted(Exception):
+    pass
+
+# ---------- the backup itself ----------
+
+def database_path():
+    """Filesystem path of the SQLite database, or None for other databases."""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return os.path.abspath(url.database)
+
+def _acquire(folder):
+    path = os.path.join(folder, LOCK_NAME)
+    try:
+        if time.time() - os.path.getmtime(path) > LOCK_STALE:
+            os.remove(path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        raise BackupError('Another backup is already running.')
+    return path
+
+def create_backup(app, progress=None):
+    """Snapshot, compress and rotate. Returns (zip path, zip size in bytes).
+
+    progress(stage, done, total) is called as pages are copied ('copy') and
+    once compression starts ('compress').
+    """
+    progress = progress or (lambda *a: None)
+    cfg = app.config
+    folder = cfg['BACKUP_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    with app.app_context():
+        source_path = database_path()
+    if not source_path or not os.path.exists(source_path):
+        raise BackupError('Backups need a file-based SQLite database.')
+
+    lock = _acquire(folder)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    snapshot = os.path.join(folder, f'.snapshot-{stamp}.db')
+    zip_path = os.path.join(folder, f'backup-{stamp}.zip')
+    try:
+        src = sqlite3.connect(source_path)
+        dst = sqlite3.connect(snapshot)
+        seen = {'remaining': None, 'restarts': 0}
+
+        def step(status, remaining, total):
+            if seen['remaining'] is not None and remaining > seen['remaining']:
+                seen['restarts'] += 1
+                if seen['restarts'] > cfg.get('BACKUP_MAX_RESTARTS', 3):
+                    raise _Restarted()
+            seen['remaining'] = remaining
+            progress('copy', total - remaining, total)
+        try:
+            src.backup(dst, pages=cfg.get('BACKUP_PAGES', 1024), progress=step,
+                       sleep=cfg.get('BACKUP_STEP_SLEEP', 0.005))
+        except _Restarted:
+            src.backup(dst)
+        try:
+            meta = {'taken': _stamp(datetime.now()), 'change_seq': _change_seq(dst)}
+        finally:
+            dst.close()
+            src.close()
+
+        progress('compress', 0, os.path.getsize(snapshot))
+        partial = zip_path + '.partial'
+        with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.write(snapshot, os.path.basename(source_path))
+            zf.writestr(META_NAME, json.dumps(meta))
+        os.replace(partial, zip_path)
+    finally:
+        for path in (snapshot, zip_path + '.partial', lock):
+            if os.path.exists(path):
+                os.remove(path)
+
+    rotate(folder, cfg.get('BACKUP_KEEP', 14))
+    return zip_path, os.path.getsize(zip_path)
+
+def list_backups(folder):
+    """[(path, size, modified datetime)] newest first."""
+    paths = sorted(glob.glob(os.path.join(folder, PATTERN)), key=os.path.getmtime, reverse=True)
+    return [(p, os.path.getsize(p), datetime.fromtimestamp(os.path.getmtime(p))) for p in paths]
+
+def backup_meta(path):
+    """{'taken', 'change_seq'} stored in a full backup; {} for older zips."""
+    with zipfile.ZipFile(path) as zf:
+        if META_NAME not in zf.namelist():
+            return {}
+        return json.loads(zf.read(META_NAME))
+
+def rotate(folder, keep):
+    """Delete all but the `keep` newest backups (keep <= 0 keeps everything),
+    and the change files that only lead up to the oldest one kept."""
+    if keep <= 0:
+        return []
+    backups = list_backups(folder)
+    removed = [p for p, _, _ in backups[keep:]]
+    positions = [backup_meta(p).get('change_seq') for p, _, _ in backups[:keep]]
+    positions = [seq for seq in positions if seq is not None]
+    if positions:
+        removed += [p for p, first, last in list_changes(folder) if last <= min(positions)]
+    for p in removed:
+        os.remove(p)
+    return removed
+
+# ---------- change log (incremental backups) ----------
+
+def _stamp(when):
+    return when.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _change_seq(conn):
+    """Last change_log seq in this sqlite3 database, or None without a change log."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='change_log'").fetchone():
+        return None
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()
+    return row[0] if row else 0
+
+def _change_triggers(conn):
+    return [name for (name,) in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'change_log\\_%' ESCAPE '\\'"))]
+
+def ensure_change_log(conn, tables, enabled):
+    """Create change_log and (re)create its triggers on `tables`, or drop them when disabled.
+
+    The triggers are rebuilt on every start so columns added since are logged too.
+    """
+    for name in _change_triggers(conn):
+        conn.execute(text(f'DROP TRIGGER {_quote(name)}'))
+    if not enabled:
+        return
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS change_log ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, at VARCHAR(23) NOT NULL, "
+        "tbl VARCHAR(64) NOT NULL, op CHAR(1) NOT NULL, key TEXT NOT NULL, row TEXT)"
+    ))
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+    for table in tables:
+        info = conn.execute(text(f'PRAGMA table_info({_quote(table)})')).fetchall()
+        cols = [r[1] for r in info]
+        pk = [r[1] for r in sorted(info, key=lambda r: r[5]) if r[5]] or ['rowid']
+        q = _quote(table)
+        lit = "'" + table.replace("'", "''") + "'"
+
+        def key(ref):
+            return 'json_array(' + ', '.join(f'{ref}.{_quote(c)}' for c in pk) + ')'
+        row = 'json_object(' + ', '.join(f"'{c}', new.{_quote(c)}" for c in cols) + ')'
+        for op, event, body in (('I', 'INSERT', f"{key('new')}, {row}"),
+                                ('U', 'UPDATE', f"{key('old')}, {row}"),
+                                ('D', 'DELETE', f"{key('old')}, NULL")):
+            conn.execute(text(
+                f"CREATE TRIGGER {_quote(f'change_log_{table}_{op.lower()}')} AFTER {event} ON {q} BEGIN "
+                f"INSERT INTO change_log(at, tbl, op, key, row) VALUES ({now}, {lit}, '{op}', {body}); END"
+            ))
+
+def list_changes(folder):
+    """[(path, first seq, last seq)] ordered by seq."""
+    out = []
+    for path in glob.glob(os.path.join(folder, CHANGES_PATTERN)):
+        first, last = os.path.basename(path)[:-len('.jsonl.gz')].split('-')[-2:]
+        out.append((path, int(first), int(last)))
+    return sorted(out, key=lambda c: (c[1], c[2]))
+
+def export_changes(app):
+    """Move the logged changes into a new changes-*.jsonl.gz. Returns (path, rows); (None, 0) if none."""
+    folder = app.config['BACKUP_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    with app.app_context():
+        source_path = database_path()
+    if not source_path or not os.path.exists(source_path):
+        raise BackupError('Backups need a file-based SQLite database.')
+
+    conn = sqlite3.connect(source_path, timeout=30, isolation_level=None)
+    partial = os.path.join(folder, f'.changes-{os.getpid()}.partial')
+    try:
+        if _change_seq(conn) is None:
+            raise BackupError('The change log is off; set BACKUP_CHANGES_MINUTES to enable it.')
+        # IMMEDIATE: another process exporting at the same time waits here
+        conn.execute('BEGIN IMMEDIATE')
+        first = last = None
+        count = 0
+        with gzip.open(partial, 'wt', encoding='utf-8') as out:
+            for seq, at, tbl, op, key, row in conn.execute(
+                    'SELECT seq, at, tbl, op, key, row FROM change_log ORDER BY seq'):
+                out.write(f'[{seq},{json.dumps(at)},{json.dumps(tbl)},"{op}",{key},{row or "null"}]\n')
+                first = seq if first is None else first
+                last, count = seq, count + 1
+        if not count:
+            conn.execute('ROLLBACK')
+            return None, 0
+        path = os.path.join(folder, f"changes-{datetime.now():%Y%m%d-%H%M%S}-{first}-{last}.jsonl.gz")
+        os.replace(partial, path)
+        conn.execute('DELETE FROM change_log WHERE seq <= ?', (last,))
+        conn.execute('COMMIT')
+        return path, count
+    finally:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+
+def _read_changes(folder, after):
+    """Logged changes with seq > after, in order, from the change files."""
+    expected = after + 1
+    for path, first, last in list_changes(folder):
+        if last < expected:
+            continue
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                change = json.loads(line)
+                if change[0] < expected:
+                    continue   # already applied (a file exported twice)
+                if change[0] > expected:
+                    raise BackupError(f'Change {expected} is missing from {folder}; cannot replay past it.')
+                expected += 1
+                yield change
+
+def _apply(conn, tbl, op, key, row, columns):
+    q = _quote(tbl)
+    pk = columns[tbl]
+    where = ' AND '.join(f'{_quote(c)} = ?' for c in pk)
+    if op == 'D':
+        conn.execute(f'DELETE FROM {q} WHERE {where}', key)
+        return
+    if op == 'U' and [row.get(c) for c in pk] != key:
+        conn.execute(f'DELETE FROM {q} WHERE {where}', key)   # primary key changed
+    cols = list(row)
+    rest = [c for c in cols if c not in pk]
+    conflict = (f"DO UPDATE SET {', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in rest)}"
+                if rest else 'DO NOTHING')
+    conn.execute(f"INSERT INTO {q} ({', '.join(map(_quote, cols))}) VALUES ({', '.join('?' * len(cols))}) "
+                 f"ON CONFLICT ({', '.join(map(_quote, pk))}) {conflict}", list(row.values()))
+
+def restore_backup(folder, target, out, base=None):
+    """Rebuild the database as it was at `target` (None = as late as the backups go) into `out`.
+
+    Returns {'base', 'taken', 'applied', 'last_at', 'next_at'}; next_at is
+    the time of the first change left out, if any.
+    """
+    if os.path.exists(out):
+        raise BackupError(f'{out} already exists.')
+    until = target.strftime('%Y-%m-%d %H:%M:%S.999') if target else None
+    candidates = [base] if base else [p for p, _, _ in list_backups(folder)]
+    chosen = None
+    for path in candidates:
+        meta = backup_meta(path)
+        if meta.get('change_seq') is not None and (until is None or meta['taken'] <= until):
+            if chosen is None or meta['taken'] > chosen[1]['taken']:
+                chosen = (path, meta)
+    if chosen is None:
+        raise BackupError('No full backup with a change log position was taken before that time.')
+    path, meta = chosen
+
+    partial = out + '.partial'
+    with zipfile.ZipFile(path) as zf:
+        name = next(n for n in zf.namelist() if n != META_NAME)
+        with zf.open(name) as src, open(partial, 'wb') as dst:
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+
+    applied, last_at, next_at = 0, meta['taken'], None
+    conn = sqlite3.connect(partial, isolation_level=None)
+    try:
+        # replayed rows must not be logged again
+        for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' "
+                                       "AND name LIKE 'change_log\\_%' ESCAPE '\\'").fetchall():
+            conn.execute(f'DROP TRIGGER {_quote(trigger)}')
+        columns = {}
+        conn.execute('BEGIN')
+        for seq, at, tbl, op, key, row in _read_changes(folder, meta['change_seq']):
+            if until is not None and at > until:
+                next_at = at
+                break
+            if tbl not in columns:
+                info = conn.execute(f'PRAGMA table_info({_quote(tbl)})').fetchall()
+                columns[tbl] = [r[1] for r in sorted(info, key=lambda r: r[5]) if r[5]] or ['rowid']
+            _apply(conn, tbl, op, key, row, columns)
+            applied, last_at = applied + 1, at
+        # new changes must number after everything already in the change files
+        last_seq = max((last for _, _, last in list_changes(folder)), default=0)
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'change_log'", (last_seq,))
+        conn.execute('COMMIT')
+        check = conn.execute('PRAGMA quick_check').fetchone()[0]
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.close()
+        os.remove(partial)
+        raise
+    conn.close()
+    if check != 'ok':
+        os.remove(partial)
+        raise BackupError(f'The restored database failed its integrity check: {check}')
+    os.replace(partial, out)
+    return {'base': path, 'taken': meta['taken'], 'applied': applied, 'last_at': last_at, 'next_at': next_at}
+
+# ---------- background jobs ----------
+
+def job_status():
+    with _job_lock:
+        return dict(_job)
+
+def _run_job(app):
+    def progress(stage, done, total):
+        with _job_lock:
+            _job.update(state='copying' if stage == 'copy' else 'compressing', done=done, total=total)
+    # everything that can raise stays in the try: a job left 'compressing'
+    # would make start_backup() refuse every later backup
+    try:
+        path, size = create_backup(app, progress)
+        with app.app_context():
+            from .utils import set_setting
+            set_setting('last_backup', datetime.now().strftime('%Y-%m-%d %H:%M'))
+    except Exception as e:
+        with _job_lock:
+            _job.update(state='failed', error=str(e), finished=datetime.now().isoformat(timespec='seconds'))
+        app.logger.warning('Backup failed: %s', e)
+        return
+    with _job_lock:
+        _job.update(state='done', path=path, size=size, finished=datetime.now().isoformat(timespec='seconds'))
+
+def start_backup(app):
+    """Queue a backup on a background thread. Returns False if one is already running."""
+    with _job_lock:
+        if _job.get('state') in ('queued', 'copying', 'compressing'):
+            return False
+        _job.clear()
+        _job.update(state='queued', started=datetime.now().isoformat(timespec='seconds'))
+    threading.Thread(target=_run_job, args=(app,), name='backup', daemon=True).start()
+    return True
+
+# ---------- schedule ----------
+
+def _schedule_loop(app, interval):
+    while True:
+        newest = list_backups(app.config['BACKUP_FOLDER'])[:1]
+        age = time.time() - newest[0][2].timestamp() if newest else None
+        if age is None or age >= interval:
+            start_backup(app)
+            wait = interval
+        else:
+            wait = interval - age
+        time.sleep(max(60, wait))
+
+def _changes_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            export_changes(app)
+        except Exception as e:
+            app.logger.warning('Incremental backup failed: %s', e)
+
+def init_backups(app):
+    """Start the backup schedulers with the first request, if BACKUP_INTERVAL_HOURS
+    or BACKUP_CHANGES_MINUTES is set."""
+    hours = app.config.get('BACKUP_INTERVAL_HOURS') or 0
+    minutes = app.config.get('BACKUP_CHANGES_MINUTES') or 0
+    loops = [(_schedule_loop, hours * 3600, 'backup-scheduler')] if hours > 0 else []
+    if minutes > 0:
+        loops.append((_changes_loop, minutes * 60, 'backup-changes'))
+    if not loops or app.testing:
+        return
+
+    @app.before_request
+    def _start_scheduler():
+        global _scheduler
+        if _scheduler is None:
+            with _job_lock:
+                if _scheduler is None:
+                    _scheduler = [threading.Thread(target=loop, args=(app, interval), name=name, daemon=True)
+                                  for loop, interval, name in loops]
+                    for thread in _scheduler:
+                        thread.start()
+
+# ---------- CLI ----------
+
+def _size(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f'{n:.0f} {unit}' if unit == 'B' else f'{n:.1f} {unit}'
+        n /= 1024
+
+@backup_cli.command('now')
+def backup_now_command():
+    """Take a backup now and rotate old ones."""
+    from flask import current_app
+    app = current_app._get_current_object()
+    shown = {'pct': -10}
+
+    def progress(stage, done, total):
+        if stage == 'compress':
+            click.echo(f'compressing {_size(total)}…')
+        elif total and done * 100 // total >= shown['pct'] + 10:
+            shown['pct'] = done * 100 // total
+            click.echo(f'copied {shown["pct"]}% of {total} pages')
+    try:
+        path, size = create_backup(app, progress)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{path} ({_size(size)})')
+
+@backup_cli.command('changes')
+def backup_changes_command():
+    """Save the changes logged since the last incremental backup."""
+    from flask import current_app
+    try:
+        path, rows = export_changes(current_app._get_current_object())
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{path} ({rows} changes)' if path else 'No changes since the last incremental backup.')
+
+@backup_cli.command('list')
+def backup_list_command():
+    """Show the backups on disk, newest first."""
+    from flask import current_app
+    folder = current_app.config['BACKUP_FOLDER']
+    for path, size, modified in list_backups(folder):
+        click.echo(f'{modified:%Y-%m-%d %H:%M}  {_size(size):>9}  {os.path.basename(path)}')
+    changes = list_changes(folder)
+    if changes:
+        size = sum(os.path.getsize(p) for p, _, _ in changes)
+        click.echo(f'{len(changes)} change files ({_size(size)}), changes {changes[0][1]}–{changes[-1][2]}')
+
+@backup_cli.command('restore')
+@click.option('--at', 'target', type=click.DateTime(['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M']),
+              help='Point in time (local); default: the latest change on disk.')
+@click.option('--to', 'out', required=True, type=click.Path(dir_okay=False), help='New database file to write.')
+@click.option('--from', 'base', type=click.Path(exists=True, dir_okay=False),
+              help='Full backup to start from (default: the newest one taken before --at).')
+def backup_restore_command(target, out, base):
+    """Rebuild the database as of a point in time into a new file."""
+    from flask import current_app
+    try:
+        result = restore_backup(current_app.config['BACKUP_FOLDER'], target, out, base)
+    except BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{os.path.basename(result['base'])} (taken {result['taken']}) "
+               f"+ {result['applied']} changes up to {result['last_at']}")
+    if result['next_at']:
+        click.echo(f"next change not applied: {result['next_at']}")
+    click.echo(f'written to {out}. Stop the app before swapping it in, then take a full backup.')
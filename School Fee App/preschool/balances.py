@@ -0,0 +1,179 @@
+# preschool/balances.py
+"""
+Set-based balance engine.
+
+Every ledger table is aggregated once per query with GROUP BY student_id and
+outer-joined onto the filtered Student set, so a report costs a constant number
+of SQL statements no matter how many students it covers.
+
+    balance = opening + receivable - waived - received + refunded
+
+where opening = Student.opening_balance - Student.opening_credit. The same
+figure is kept denormalised in Student.balance_amount / credit_balance by
+ledger.py; student_balances() reads that column, everything else aggregates.
+
+Fees with a due date (fee plan installments) are part of the balance from
+the day they are assigned. What is *overdue* as of a date is that balance
+minus the fees not yet due, so overdue_query() only has to aggregate the
+future slice of student_fee (an index range on due_date).
+"""
+from sqlalchemy import func, select, type_coerce
+from .extensions import db
+from .models import Student, StudentFee, Receipt, Waiver, Refund
+from .utils import D
+
+MONEY = db.Numeric(12, 2)
+
+# ---------- building blocks ----------
+
+def _sum_by_student(amount_col, student_col, *criteria):
+    """Grouped SUM(amount) per student as a subquery (student_id, total)."""
+    return (
+        select(student_col.label('student_id'), func.sum(amount_col).label('total'))
+        .where(*criteria)
+        .group_by(student_col)
+        .subquery()
+    )
+
+def _money(expr, label):
+    return type_coerce(expr, MONEY).label(label)
+
+def _ledger(student_ids=None):
+    """Return (subqueries, columns) for opening/receivable/received/waived/refunded/balance.
+
+    With student_ids, each grouped subquery only aggregates those students
+    (via the student_id indexes) instead of the whole table.
+    """
+    def only(col):
+        return (col.in_(student_ids),) if student_ids is not None else ()
+    fees = _sum_by_student(StudentFee.amount, StudentFee.student_id, *only(StudentFee.student_id))
+    paid = _sum_by_student(Receipt.amount, Receipt.student_id, *only(Receipt.student_id))
+    waived = _sum_by_student(Waiver.amount, Waiver.student_id, Waiver.approved == True, *only(Waiver.student_id))
+    refunded = _sum_by_student(Refund.amount, Refund.student_id, *only(Refund.student_id))
+
+    opn = func.coalesce(Student.opening_balance, 0) - func.coalesce(Student.opening_credit, 0)
+    rcv = func.coalesce(fees.c.total, 0)
+    rec = func.coalesce(paid.c.total, 0)
+    wav = func.coalesce(waived.c.total, 0)
+    ref = func.coalesce(refunded.c.total, 0)
+    bal = opn + rcv - wav - rec + ref
+
+    cols = {
+        'opening': opn,
+        'receivable': rcv,
+        'received': rec,
+        'waived': wav,
+        'refunded': ref,
+        'balance': bal,
+    }
+    return (fees, paid, waived, refunded), cols
+
+def _join_ledger(q, subqueries):
+    for sq in subqueries:
+        q = q.outerjoin(sq, sq.c.student_id == Student.id)
+    return q
+
+# ---------- public API ----------
+
+def balance_query(*criteria, student_ids=None, entities=(Student,)):
+    """Query of (Student, opening, receivable, received, waived, refunded, balance) rows.
+
+    `criteria` are ordinary filters on Student; the result is a regular
+    Query so callers can add .filter() / .order_by() / .limit(). Pass
+    student_ids when the set is a known list of ids, and `entities` to
+    select Student columns instead of whole objects.
+    """
+    subqueries, cols = _ledger(student_ids)
+    q = db.session.query(*entities, *[_money(expr, name) for name, expr in cols.items()])
+    q = _join_ledger(q, subqueries)
+    if student_ids is not None:
+        q = q.filter(Student.id.in_(student_ids))
+    if criteria:
+        q = q.filter(*criteria)
+    return q
+
+def _persisted_balances(entities, criteria, positive_only, order_by):
+    bal = func.coalesce(Student.balance_amount, 0)
+    q = db.session.query(*entities, _money(bal, 'balance'))
+    if criteria:
+        q = q.filter(*criteria)
+    if positive_only:
+        q = q.filter(bal > 0)
+    return q.order_by(*(order_by if order_by is not None else (bal.desc(), Student.name.asc())))
+
+def student_balances(*criteria, positive_only=True, order_by=None, limit=None):
+    """Return [(student, balance)] for the filtered set in a single query.
+
+    Reads the persisted Student.balance_amount, so no aggregation happens.
+    Defaults to students that owe money, largest balance first.
+    """
+    q = _persisted_balances((Student,), criteria, positive_only, order_by)
+    if limit:
+        q = q.limit(limit)
+    return [(s, D(b or 0)) for s, b in q]
+
+def balance_rows(*criteria, positive_only=True, order_by=None):
+    """Like student_balances(), but an unevaluated Query of plain column tuples
+    (admission_no, name, class_name, section, phone, balance) for exports."""
+    cols = (Student.admission_no, Student.name, Student.class_name, Student.section, Student.phone)
+    return _persisted_balances(cols, criteria, positive_only, order_by)
+
+def _overdue_expr(as_of):
+    """(subquery of fees due after as_of, amount-due expression)."""
+    future = _sum_by_student(StudentFee.amount, StudentFee.student_id, StudentFee.due_date > as_of)
+    net = func.coalesce(Student.balance_amount, 0) - func.coalesce(Student.credit_balance, 0)
+    return future, net - func.coalesce(future.c.total, 0)
+
+def overdue_query(*criteria, as_of, entities=(Student,), order_by=None):
+    """Query of (*entities, amount_due) for students owing fees due by `as_of`.
+
+    Defaults to the largest amount first.
+    """
+    future, due = _overdue_expr(as_of)
+    q = (db.session.query(*entities, _money(due, 'balance')).select_from(Student)
+         .outerjoin(future, future.c.student_id == Student.id))
+    if criteria:
+        q = q.filter(*criteria)
+    q = q.filter(due > 0)
+    return q.order_by(*(order_by if order_by is not None else (due.desc(), Student.name.asc())))
+
+def overdue_balances(*criteria, as_of, order_by=None, limit=None):
+    """[(student, amount_due)] for fees due by `as_of`."""
+    q = overdue_query(*criteria, as_of=as_of, order_by=order_by)
+    if limit:
+        q = q.limit(limit)
+    return [(s, D(b or 0)) for s, b in q]
+
+def overdue_count(*criteria, as_of):
+    future, due = _overdue_expr(as_of)
+    q = (db.session.query(func.count(Student.id)).select_from(Student)
+         .outerjoin(future, future.c.student_id == Student.id))
+    return q.filter(*criteria, due > 0).scalar() or 0
+
+def balance_totals(*criteria):
+    """Sum receivable/received/waived/refunded/balance over the filtered set.
+
+    Also returns `students` (rows in the set) and `overdue` (rows with a
+    positive balance). One query.
+    """
+    subqueries, cols = _ledger()
+    bal = cols['balance']
+    aggs = [_money(func.coalesce(func.sum(expr), 0), name) for name, expr in cols.items()]
+    aggs.append(func.count(Student.id).label('students'))
+    aggs.append(func.coalesce(func.sum(db.case((bal > 0, 1), else_=0)), 0).label('overdue'))
+    q = _join_ledger(db.session.query(*aggs).select_from(Student), subqueries)
+    if criteria:
+        q = q.filter(*criteria)
+    row = q.one()
+    out = {name: D(getattr(row, name) or 0) for name in cols}
+    out['students'] = int(row.students or 0)
+    out['overdue'] = int(row.overdue or 0)
+    return out
+
+def balance_for(student_id):
+    """Ledger figures for one student as a dict of Decimals."""
+    row = balance_query(student_ids=[student_id]).first()
+    names = ('opening', 'receivable', 'received', 'waived', 'refunded', 'balance')
+    if row is None:
+        return {name: D(0) for name in names}
+    return {name: D(getattr(row, name) or 0) for name in names}
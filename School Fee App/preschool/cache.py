@@ -0,0 +1,91 @@
+# preschool/cache.py
+"""
+Small in-process caches with commit-driven invalidation.
+
+Caches subscribe to *topics*. A session that flushes a model registered with
+watch() marks its topics; Core statements that bypass the ORM call touch()
+instead. When the session commits, every cache on those topics is cleared.
+Rolled-back sessions invalidate nothing.
+"""
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_models = {}      # mapped class -> {topic}
+_caches = {}      # topic -> [TTLCache]
+_lock = threading.Lock()
+
+def watch(topic, *models):
+    """Invalidate `topic` whenever rows of these models are committed."""
+    for m in models:
+        _models.setdefault(m, set()).add(topic)
+
+def touch(session, *topics):
+    """Mark topics dirty on `session` (for Core updates the ORM can't see)."""
+    session.info.setdefault('cache_topics', set()).update(topics)
+
+def invalidate(*topics):
+    for topic in topics:
+        for cache in _caches.get(topic, ()):
+            cache.clear()
+
+class TTLCache:
+    """Thread-safe key -> value cache with a time-to-live and topic invalidation.
+
+    With max_entries set, the cache is emptied when it fills up; that is
+    crude, but these caches are small and cheap to refill.
+    """
+
+    def __init__(self, ttl, *topics, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._generation = 0
+        for topic in topics:
+            _caches.setdefault(topic, []).append(self)
+
+    def get(self, key, loader, ttl=None):
+        """Return the cached value for `key`, calling loader() on a miss."""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        with _lock:
+            hit = self._data.get(key)
+            if hit and (hit[0] is None or hit[0] > now):
+                return hit[1]
+            generation = self._generation
+        value = loader()
+        with _lock:
+            # don't store a value computed while an invalidation happened
+            if generation == self._generation:
+                if self.max_entries and len(self._data) >= self.max_entries:
+                    self._data.clear()
+                self._data[key] = (now + ttl if ttl is not None else None, value)
+        return value
+
+    def clear(self):
+        with _lock:
+            self._data.clear()
+            self._generation += 1
+
+# ---------- session hooks ----------
+
+@event.listens_for(Session, 'after_flush')
+def _collect_topics(session, flush_context):
+    if not _models:
+        return
+    topics = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        topics.update(_models.get(type(obj), ()))
+    if topics:
+        touch(session, *topics)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    topics = session.info.pop('cache_topics', None)
+    if topics:
+        invalidate(*topics)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('cache_topics', None)
@@ -0,0 +1,43 @@
+# preschool/dashboard.py
+"""
+Dashboard figures, computed in the database and cached briefly.
+
+The snapshot holds plain values (no ORM objects) so it can be shared across
+requests. It expires after DASHBOARD_CACHE_TTL seconds and is dropped as soon
+as a receipt, fee, waiver, refund or student change commits.
+"""
+from collections import namedtuple
+from datetime import date
+from flask import current_app
+from .models import Student, StudentFee, Receipt, Waiver, Refund
+from .cache import TTLCache, watch
+from .balances import balance_totals, overdue_query
+from .reports import _overdue_cond
+from .utils import D
+
+TOP_N = 10
+
+OverdueRow = namedtuple('OverdueRow', 'id admission_no name class_name section phone')
+
+watch('balances', Student, StudentFee, Receipt, Waiver, Refund)
+_snapshots = TTLCache(30, 'balances')
+
+def _load():
+    # the same balance engine as the summary report: opening balances,
+    # waivers and refunds included
+    totals = balance_totals()
+
+    # same students and amounts as /reports/overdue: fees due by today only
+    top = overdue_query(_overdue_cond(), as_of=date.today(), entities=(
+        Student.id, Student.admission_no, Student.name, Student.class_name,
+        Student.section, Student.phone)).limit(TOP_N).all()
+    return {
+        'receivable': totals['receivable'],
+        'received': totals['received'],
+        'balance': totals['balance'],
+        'top_overdue': [(OverdueRow(*row[:-1]), D(row[-1])) for row in top],
+    }
+
+def dashboard_snapshot():
+    """Totals plus the top-N students by amount overdue; constant work per call."""
+    return _snapshots.get('dashboard', _load, ttl=current_app.config.get('DASHBOARD_CACHE_TTL'))
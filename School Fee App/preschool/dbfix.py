@@ -3,13 +3,23 @@
 Idempotent schema fixer for SQLite.
 Adds/updates columns needed by recent features.
 Safe to run at every startup.
+
+Returns the set of "table.column" names it added, so callers can run
+follow-up data migrations (e.g. a ledger rebuild) only when needed.
+
+Indexes declared on the models are created here too: create_all() only
+builds them together with a new table, so older databases never got them.
 """
+from flask import current_app
 from sqlalchemy import text
+from .search import ensure_student_fts
+from .backups import ensure_change_log
 
 def ensure_schema(db):
     engine = db.engine
+    added = set()
     if engine.dialect.name != "sqlite":
-        return
+        return added
 
     with engine.begin() as conn:
         def table_exists(name: str) -> bool:
@@ -22,6 +32,7 @@ def ensure_schema(db):
 
         def add_col(table: str, decl: str):
             conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {decl}"))
+            added.add(f"{table}.{decl.split()[0]}")
 
         # --- bank_credit: legacy table for statement imports (optional)
         if table_exists("bank_credit"):
@@ -31,6 +42,22 @@ def ensure_schema(db):
                 add_col("bank_credit", "utr VARCHAR(64)")
             if not has_col("bank_credit", "created_at"):
                 add_col("bank_credit", "created_at DATETIME")
+            if not has_col("bank_credit", "batch_id"):
+                add_col("bank_credit", "batch_id INTEGER")
+            if not has_col("bank_credit", "duplicate_of"):
+                add_col("bank_credit", "duplicate_of INTEGER")
+            # UTRs are unique from now on. Lines imported before that keep their
+            # UTR; repeats point at the first line and sit outside the partial
+            # unique index below.
+            marked = conn.execute(text(
+                "UPDATE bank_credit SET duplicate_of = (SELECT MIN(b.id) FROM bank_credit b "
+                "WHERE b.utr = bank_credit.utr AND b.duplicate_of IS NULL) "
+                "WHERE utr IS NOT NULL AND duplicate_of IS NULL AND id > "
+                "(SELECT MIN(b.id) FROM bank_credit b WHERE b.utr = bank_credit.utr AND b.duplicate_of IS NULL)"
+            )).rowcount
+            if marked:
+                current_app.logger.warning("bank_credit: %d line(s) repeat an earlier UTR; kept and marked "
+                                           "duplicate_of", marked)
 
         # --- settlement_batch: ensure expected new fields exist
         if table_exists("settlement_batch"):
@@ -42,6 +69,7 @@ def ensure_schema(db):
                 "days_grouping":  "INTEGER DEFAULT 2",
                 "provider":       "VARCHAR(50) DEFAULT 'UPI'",
                 "rule_id":        "INTEGER",
+                "status":         "VARCHAR(20) DEFAULT 'Open'",
             }
             for col, decl in needed.items():
                 if not has_col("settlement_batch", col):
@@ -53,3 +81,43 @@ def ensure_schema(db):
                 add_col("cash_count", "expected NUMERIC DEFAULT 0")
             if not has_col("cash_count", "variance"):
                 add_col("cash_count", "variance NUMERIC DEFAULT 0")
+
+        # --- student: opening amounts split out of the ledger-maintained balances.
+        # Until now balance_amount/credit_balance only ever held imported
+        # opening figures, so carry them over before the ledger rebuild.
+        if table_exists("student"):
+            if not has_col("student", "opening_balance"):
+                add_col("student", "opening_balance NUMERIC DEFAULT 0")
+                conn.execute(text("UPDATE student SET opening_balance = COALESCE(balance_amount, 0)"))
+            if not has_col("student", "opening_credit"):
+                add_col("student", "opening_credit NUMERIC DEFAULT 0")
+                conn.execute(text("UPDATE student SET opening_credit = COALESCE(credit_balance, 0)"))
+
+        # --- student_fee: due dates and the plan installment a row came from
+        if table_exists("student_fee"):
+            for col, decl in (("due_date", "DATE"), ("plan_id", "INTEGER"), ("installment_id", "INTEGER")):
+                if not has_col("student_fee", col):
+                    add_col("student_fee", f"{col} {decl}")
+
+        # --- student_fts: full-text index kept in sync by triggers
+        if table_exists("student"):
+            ensure_student_fts(conn)
+
+        # --- change_log: row changes for incremental backups, when enabled
+        ensure_change_log(conn, [t.name for t in db.metadata.sorted_tables if table_exists(t.name)],
+                          (current_app.config.get("BACKUP_CHANGES_MINUTES") or 0) > 0)
+
+        # --- model indexes (CREATE INDEX IF NOT EXISTS)
+        for table in db.metadata.sorted_tables:
+            if not table_exists(table.name):
+                continue
+            for index in table.indexes:
+                if all(has_col(table.name, c.name) for c in index.columns):
+                    where = index.dialect_options["sqlite"]["where"]
+                    conn.execute(text(
+                        f"CREATE {'UNIQUE ' if index.unique else ''}INDEX IF NOT EXISTS {index.name} "
+                        f"ON {table.name} ({', '.join(c.name for c in index.columns)})"
+                        + (f" WHERE {where}" if where is not None else "")
+                    ))
+
+    return added
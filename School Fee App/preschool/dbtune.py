@@ -0,0 +1,39 @@
+# preschool/dbtune.py
+"""
+SQLite connection profile.
+
+SQLITE_PRAGMAS are applied to every new DBAPI connection the engine opens:
+
+- journal_mode=WAL: report reads no longer block a cashier's write (or the
+  other way round); readers see the last committed state while a write is
+  in progress. The mode is stored in the file, so it sticks after the
+  first connection.
+- synchronous=NORMAL: in WAL mode commits skip one fsync; an application
+  crash loses nothing, a power cut can lose the last commits but never
+  corrupts the file.
+- busy_timeout: a writer waits up to this many ms for the write lock
+  instead of failing at once with "database is locked".
+- cache_size / mmap_size: keep hot pages in memory per connection.
+
+Pool sizes live in SQLALCHEMY_ENGINE_OPTIONS (config.py). In-memory
+databases and other backends are left alone.
+"""
+from sqlalchemy import event
+from .extensions import db
+
+def _set_pragmas(pragmas):
+    def on_connect(dbapi_conn, record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return on_connect
+
+def init_sqlite(app):
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        engine = db.engine
+    url = engine.url
+    if not pragmas or url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return
+    event.listen(engine, 'connect', _set_pragmas(pragmas))
@@ -0,0 +1,39 @@
+# preschool/exports.py
+"""
+Streaming CSV responses.
+
+Rows are pulled from the database in batches (Query.yield_per) and written
+through the csv module into a small buffer that is flushed to the client every
+CHUNK characters, so an export's memory use does not grow with its size and
+the first bytes go out before the query has finished.
+"""
+import csv
+import io
+from flask import Response, stream_with_context
+
+BATCH = 1000          # rows fetched per round trip
+CHUNK = 64 * 1024     # characters buffered before a write to the client
+
+def stream(query, batch=BATCH):
+    """Iterate a Query in batches instead of loading every row first."""
+    return query.yield_per(batch)
+
+def money(value):
+    return f"{value or 0:.2f}"
+
+def csv_chunks(header, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= CHUNK:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def csv_response(filename, header, rows):
+    """Stream `rows` (any iterable of sequences) as a CSV attachment."""
+    return Response(stream_with_context(csv_chunks(header, rows)), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
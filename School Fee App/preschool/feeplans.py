@@ -0,0 +1,82 @@
+# preschool/feeplans.py
+"""
+Fee plans: a fee type billed as dated installments.
+
+assign_plan() expands a plan across a cohort in one vectorized pass: the
+cohort's student ids are cross-joined with the plan's installments in pandas,
+rows that already exist (same student and installment) are dropped with an
+anti-join, and what remains is written with executemany batches together
+with the matching StudentPlan links and per-student balance deltas. Running
+it again for the same cohort adds nothing.
+"""
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .extensions import db
+from .models import Student, StudentFee, StudentPlan
+from .ledger import post_many
+from .utils import D
+
+BATCH = 5000
+COLUMNS = ['student_id', 'installment_id', 'due_date', 'amount']
+
+def _frame(stmt, columns):
+    import pandas as pd
+    return pd.DataFrame(db.session.execute(stmt).all(), columns=columns)
+
+def expand_plan(plan, criteria=(), from_date=None):
+    """DataFrame of the StudentFee rows `plan` would add for the cohort.
+
+    Columns: student_id, installment_id, due_date, amount. Installments due
+    before `from_date` are skipped (late admissions).
+    """
+    import pandas as pd
+    installments = pd.DataFrame(
+        [(i.id, i.due_date, D(i.amount or 0)) for i in plan.installments
+         if from_date is None or i.due_date >= from_date],
+        columns=COLUMNS[1:],
+    )
+    students = _frame(select(Student.id).where(*criteria), COLUMNS[:1])
+    if students.empty or installments.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    rows = students.merge(installments, how='cross')
+    existing = _frame(
+        select(StudentFee.student_id, StudentFee.installment_id)
+        .where(StudentFee.installment_id.in_(installments['installment_id'].tolist())),
+        ['student_id', 'installment_id'],
+    )
+    if not existing.empty:
+        rows = rows.merge(existing, how='left', on=['student_id', 'installment_id'], indicator=True)
+        rows = rows[rows['_merge'] == 'left_only'].drop(columns='_merge')
+    return rows[COLUMNS]
+
+def assign_plan(plan, criteria=(), from_date=None):
+    """Charge `plan` to the cohort. Caller commits.
+
+    Returns (students charged, installment rows created).
+    """
+    rows = expand_plan(plan, criteria, from_date)
+    if rows.empty:
+        return 0, 0
+
+    student_ids = rows['student_id'].tolist()
+    records = [
+        {'student_id': sid, 'fee_type_id': plan.fee_type_id, 'plan_id': plan.id,
+         'installment_id': iid, 'due_date': due, 'amount': amount}
+        for sid, iid, due, amount in zip(student_ids, rows['installment_id'].tolist(),
+                                         rows['due_date'].tolist(), rows['amount'].tolist())
+    ]
+    # Core insert on the table: no per-row ORM bookkeeping for rows nobody reads back
+    rows_insert = StudentFee.__table__.insert()
+    for start in range(0, len(records), BATCH):
+        db.session.execute(rows_insert, records[start:start + BATCH])
+
+    charged = sorted(set(student_ids))
+    links = sqlite_insert(StudentPlan).on_conflict_do_nothing(index_elements=['student_id', 'plan_id'])
+    for start in range(0, len(charged), BATCH):
+        db.session.execute(links, [{'student_id': sid, 'plan_id': plan.id} for sid in charged[start:start + BATCH]])
+
+    totals = rows.groupby('student_id')['amount'].sum()
+    post_many(dict(zip(totals.index.tolist(), totals.tolist())))
+    return len(charged), len(records)
+
@@ -1,21 +1,36 @@
 # preschool/fees.py
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from flask_login import login_required
+from flask_login import login_required, current_user
+from datetime import datetime
+from sqlalchemy import func
 from .extensions import db
-from .models import Student, FeeType
-# Fee plan model name can vary; try the typical class
-try:
-    from .models import FeePlan
-except Exception:
-    FeePlan = None
-# optional mapping table if your schema uses many-to-many
-try:
-    from .models import StudentPlan
-except Exception:
-    StudentPlan = None
+from .models import Student, FeeType, FeePlan, FeePlanInstallment, StudentPlan
+from .security import role_required, audit
+from .utils import D
+from .assignments import cohort, preview, assign_fee
+from .feeplans import assign_plan
 
 fees_bp = Blueprint('fees', __name__)
 
+PLAN_ROWS = 12  # installment rows on the new-plan form
+
+# ---------- helpers ----------
+
+def _cohort_from_form():
+    """(criteria, error) from the class/section/students/all form fields."""
+    cls = request.form.get('class_name') or None
+    sec = request.form.get('section') or None
+    student_ids = [int(x) for x in request.form.getlist('student_ids') if x.isdigit()]
+    if not (cls or sec or student_ids or request.form.get('all_students') == '1'):
+        return None, 'Pick a class, section or students (or tick "All active students").'
+    return cohort(cls, sec, student_ids or None,
+                  active_only=request.form.get('include_discontinued') != '1'), None
+
+def _class_lists():
+    classes = [c for (c,) in db.session.query(Student.class_name).distinct().order_by(Student.class_name) if c]
+    sections = [c for (c,) in db.session.query(Student.section).distinct().order_by(Student.section) if c]
+    return classes, sections
+
 @fees_bp.route('/fees/types')
 @login_required
 def types():
@@ -25,37 +40,115 @@ def types():
 @fees_bp.route('/fees/plans')
 @login_required
 def plans():
-    plans = FeePlan.query.order_by(FeePlan.name.asc()).all() if FeePlan else []
-    return render_template('fees/plans.html', plans=plans)
+    plans = FeePlan.query.order_by(FeePlan.name.asc()).all()
+    assigned = dict(db.session.query(StudentPlan.plan_id, func.count(StudentPlan.id)).group_by(StudentPlan.plan_id))
+    types = FeeType.query.filter(FeeType.is_active != False).order_by(FeeType.name.asc()).all()
+    classes, sections = _class_lists()
+    return render_template('fees/plans.html', plans=plans, assigned=assigned, types=types,
+                           classes=classes, sections=sections, plan_rows=PLAN_ROWS)
+
+@fees_bp.route('/fees/plans/new', methods=['POST'])
+@role_required(['Owner', 'Manager'])
+def new_plan():
+    name = (request.form.get('name') or '').strip()
+    try:
+        fee_type_id = int(request.form['fee_type_id'])
+        rows = []
+        for i in range(1, PLAN_ROWS + 1):
+            due, amt = request.form.get(f'due_{i}'), request.form.get(f'amount_{i}')
+            if not due and not amt:
+                continue
+            rows.append((request.form.get(f'label_{i}') or f'Installment {len(rows) + 1}',
+                         datetime.strptime(due, '%Y-%m-%d').date(), D(amt)))
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        flash('Each installment needs a due date and an amount.', 'danger')
+        return redirect(url_for('fees.plans'))
+    if not name or not rows or any(not amt.is_finite() or amt <= 0 for _, _, amt in rows):
+        flash('Give the plan a name and at least one installment with a positive amount.', 'warning')
+        return redirect(url_for('fees.plans'))
+    if FeePlan.query.filter_by(name=name).first():
+        flash('A plan with that name already exists.', 'warning')
+        return redirect(url_for('fees.plans'))
+    plan = FeePlan(name=name, fee_type_id=fee_type_id)
+    rows.sort(key=lambda r: r[1])
+    plan.installments = [FeePlanInstallment(seq=n, label=label, due_date=due, amount=amt)
+                         for n, (label, due, amt) in enumerate(rows, 1)]
+    db.session.add(plan)
+    db.session.commit()
+    audit(actor=current_user.username, action='CREATE', table='fee_plan', record_id=plan.id, before={},
+          after={'name': name, 'installments': len(rows), 'total': str(plan.total())})
+    flash(f'Plan {name} created.', 'success')
+    return redirect(url_for('fees.plans'))
+
+@fees_bp.route('/fees/plans/assign', methods=['POST'])
+@role_required(['Owner', 'Manager'])
+def assign_plan_to_students():
+    plan = FeePlan.query.get_or_404(request.form.get('plan_id', type=int))
+    criteria, error = _cohort_from_form()
+    if error:
+        flash(error, 'warning')
+        return redirect(url_for('fees.plans'))
+    from_date = None
+    if request.form.get('from_date'):
+        try:
+            from_date = datetime.strptime(request.form['from_date'], '%Y-%m-%d').date()
+        except ValueError:
+            flash('Invalid "skip installments due before" date.', 'danger')
+            return redirect(url_for('fees.plans'))
+    try:
+        students, rows = assign_plan(plan, criteria, from_date)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Assignment failed: {e}', 'danger')
+        return redirect(url_for('fees.plans'))
+    audit(actor=current_user.username, action='BULK_ASSIGN', table='student_fee', record_id='-', before={},
+          after={'plan': plan.name, 'students': students, 'installments': rows})
+    flash(f'{plan.name}: {rows} installment(s) created for {students} student(s).', 'success')
+    return redirect(url_for('fees.plans'))
 
 @fees_bp.route('/fees/bulk-assign', methods=['GET', 'POST'])
-@login_required
+@role_required(['Owner', 'Manager'])
 def bulk_assign():
     if request.method == 'POST':
-        plan_id = int(request.form['plan_id'])
-        student_ids = request.form.getlist('student_ids')
-        if not student_ids:
-            flash('Please select at least one student.', 'warning')
+        try:
+            fee_type_id = int(request.form['fee_type_id'])
+            amount = D(request.form.get('amount') or 0)
+            student_ids = [int(x) for x in request.form.getlist('student_ids') if x]
+            due_date = (datetime.strptime(request.form['due_date'], '%Y-%m-%d').date()
+                        if request.form.get('due_date') else None)
+        except (KeyError, ValueError, ArithmeticError):
+            flash('Invalid input. Please check the fee type, amount and due date.', 'danger')
             return redirect(url_for('fees.bulk_assign'))
-
-        count = 0
-        for sid in student_ids:
-            s = Student.query.get(int(sid))
-            if not s:
-                continue
-            # If Student has a plan_id field
-            if hasattr(s, 'plan_id'):
-                s.plan_id = plan_id
-                count += 1
-            elif StudentPlan is not None:
-                db.session.add(StudentPlan(student_id=s.id, plan_id=plan_id))
-                count += 1
-            # else: no known place to store; skip
-
-        db.session.commit()
-        flash(f'Assigned plan to {count} student(s).', 'success')
+        if not amount.is_finite() or amount <= 0:
+            flash('Enter an amount greater than zero.', 'warning')
+            return redirect(url_for('fees.bulk_assign'))
+        criteria, error = _cohort_from_form()
+        if error:
+            flash(error, 'warning')
+            return redirect(url_for('fees.bulk_assign'))
+        ft = FeeType.query.get_or_404(fee_type_id)
+        try:
+            total, _ = preview(fee_type_id, *criteria, due_date=due_date)
+            count = assign_fee(fee_type_id, amount, *criteria, due_date=due_date)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Assignment failed: {e}', 'danger')
+            return redirect(url_for('fees.bulk_assign'))
+        audit(actor=current_user.username, action='BULK_ASSIGN', table='student_fee', record_id='-', before={},
+              after={'fee_type': ft.name, 'amount': str(amount), 'due_date': str(due_date or ''),
+                     'class': request.form.get('class_name'),
+                     'section': request.form.get('section'), 'students': len(student_ids) or None,
+                     'charged': count})
+        skipped = total - count
+        msg = f'Assigned {ft.name} (₹ {amount:.2f}) to {count} student(s).'
+        if skipped:
+            msg += f' {skipped} already had it for this due date.'
+        flash(msg, 'success')
         return redirect(url_for('fees.bulk_assign'))
 
-    students = Student.query.order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc()).all()
-    plans = FeePlan.query.order_by(FeePlan.name.asc()).all() if FeePlan else []
-    return render_template('fees/bulk_assign.html', students=students, plans=plans)
+    # students are picked through the /students/search typeahead
+    types = FeeType.query.filter(FeeType.is_active != False).order_by(FeeType.name.asc()).all()
+    classes, sections = _class_lists()
+    return render_template('fees/bulk_assign.html', types=types, classes=classes, sections=sections)
@@ -0,0 +1,194 @@
+# preschool/imports.py
+"""
+Bulk CSV imports.
+
+Uploads are decoded as a stream (no full read into memory). Lookups that used
+to be one query per row are done once up front into a set/dict, and rows are
+written with executemany batches of BATCH. Every rejected row is reported as
+(line, admission_no or UTR, reason) instead of being skipped silently.
+"""
+import csv
+import io
+from datetime import datetime
+from decimal import InvalidOperation
+from itertools import islice
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .extensions import db
+from .models import Student, BankCredit
+from .cache import touch
+from .utils import D
+
+BATCH = 1000
+STUDENT_FIELDS = ('admission_no', 'name', 'class_name', 'section', 'parent_name', 'phone', 'email')
+
+def read_csv(file_storage):
+    """DictReader over an uploaded file, decoded on the fly (BOM tolerant)."""
+    return csv.DictReader(io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline=''))
+
+def _chunks(reader, size):
+    """Yield lists of (line, row) of at most `size` rows."""
+    while True:
+        chunk = [(reader.line_num, row) for row in islice(reader, size)]
+        if not chunk:
+            return
+        yield chunk
+
+def _amount(raw):
+    """Decimal for a non-negative money string; None if blank; ValueError if invalid."""
+    raw = (raw or '').strip().replace(',', '')
+    if not raw:
+        return None
+    try:
+        value = D(raw)
+    except InvalidOperation:
+        raise ValueError(f'not a number: {raw!r}')
+    if not value.is_finite() or value < 0:
+        raise ValueError(f'not a valid amount: {raw!r}')
+    return value.quantize(D('0.01'))
+
+def _clean(row, fields):
+    return {k: ((row.get(k) or '').strip() or None) for k in fields}
+
+def import_students(reader, batch=BATCH):
+    """Insert new students from CSV rows. Caller commits.
+
+    Returns {'inserted': n, 'errors': [(line, admission_no, reason), ...]}.
+    """
+    existing = {a for (a,) in db.session.query(Student.admission_no).filter(Student.admission_no.isnot(None))}
+    seen = set()
+    errors = []
+    pending = []
+    inserted = 0
+
+    def flush():
+        nonlocal inserted
+        if pending:
+            db.session.execute(insert(Student), pending)
+            inserted += len(pending)
+            pending.clear()
+
+    for row in reader:
+        line = reader.line_num
+        values = _clean(row, STUDENT_FIELDS)
+        adm = values['admission_no']
+        if not adm or not values['name']:
+            errors.append((line, adm or '', 'admission_no and name are required'))
+        elif adm in existing:
+            errors.append((line, adm, 'admission number already exists'))
+        elif adm in seen:
+            errors.append((line, adm, 'duplicate admission number in file'))
+        else:
+            seen.add(adm)
+            pending.append(values)
+            if len(pending) >= batch:
+                flush()
+    flush()
+    if inserted:
+        touch(db.session, 'students')
+    return {'inserted': inserted, 'errors': errors}
+
+OPENING_FIELDS = {'opening_balance': 'opening_balance', 'credit_balance': 'opening_credit'}
+
+def import_opening(reader, chunk=BATCH):
+    """Set opening balance/credit for existing students from CSV rows. Caller commits.
+
+    Each chunk costs one id lookup, executemany UPDATEs by primary key and a
+    ledger rebuild for just those students. Returns
+    {'updated': n, 'errors': [(line, admission_no, reason), ...]}.
+    """
+    from .ledger import rebuild_balances
+    errors = []
+    seen = set()
+    updated = 0
+    for rows in _chunks(reader, chunk):
+        parsed = []
+        for line, row in rows:
+            adm = (row.get('admission_no') or '').strip()
+            if not adm:
+                errors.append((line, '', 'admission_no is required'))
+                continue
+            if adm in seen:
+                errors.append((line, adm, 'duplicate admission number in file'))
+                continue
+            seen.add(adm)
+            try:
+                values = {col: _amount(row.get(field)) for field, col in OPENING_FIELDS.items()}
+            except ValueError as e:
+                errors.append((line, adm, str(e)))
+                continue
+            values = {col: v for col, v in values.items() if v is not None}
+            if not values:
+                errors.append((line, adm, 'no amounts given'))
+                continue
+            parsed.append((line, adm, values))
+
+        ids = dict(db.session.query(Student.admission_no, Student.id)
+                   .filter(Student.admission_no.in_([adm for _, adm, _ in parsed])))
+        mappings = []
+        for line, adm, values in parsed:
+            if adm not in ids:
+                errors.append((line, adm, 'no student with this admission number'))
+            else:
+                mappings.append({'id': ids[adm], **values})
+        if mappings:
+            # the ORM batches consecutive rows with the same keys; keep each
+            # shape (balance only / credit only / both) together
+            mappings.sort(key=lambda m: sorted(m))
+            db.session.execute(update(Student), mappings)
+            rebuild_balances([m['id'] for m in mappings])
+            updated += len(mappings)
+    if updated:
+        touch(db.session, 'balances', 'students')
+    return {'updated': updated, 'errors': errors}
+
+def import_bank_credits(reader, chunk=BATCH):
+    """Add bank statement lines (date, amount_net, utr). Caller commits.
+
+    A UTR already imported, or repeated in the file, is reported and skipped;
+    the unique index on bank_credit.utr backs this up. Returns
+    {'inserted': n, 'errors': [(line, utr, reason), ...]}.
+    """
+    errors = []
+    seen = set()
+    inserted = 0
+    stmt = sqlite_insert(BankCredit).on_conflict_do_nothing(index_elements=['utr'],
+                                                              index_where=BankCredit.duplicate_of.is_(None))
+    for rows in _chunks(reader, chunk):
+        parsed = []
+        for line, row in rows:
+            utr = (row.get('utr') or '').strip()
+            if not utr:
+                errors.append((line, '', 'utr is required'))
+                continue
+            if utr in seen:
+                errors.append((line, utr, 'duplicate UTR in file'))
+                continue
+            seen.add(utr)
+            try:
+                day = datetime.strptime((row.get('date') or '').strip(), '%Y-%m-%d').date()
+            except ValueError:
+                errors.append((line, utr, f"date must be YYYY-MM-DD: {row.get('date')!r}"))
+                continue
+            try:
+                amount = _amount(row.get('amount_net'))
+            except ValueError as e:
+                errors.append((line, utr, str(e)))
+                continue
+            if not amount:
+                errors.append((line, utr, 'amount_net is required'))
+                continue
+            parsed.append((line, {'date': day, 'amount_net': amount, 'utr': utr}))
+
+        existing = {u for (u,) in db.session.query(BankCredit.utr)
+                    .filter(BankCredit.utr.in_([v['utr'] for _, v in parsed]))}
+        values = []
+        for line, v in parsed:
+            if v['utr'] in existing:
+                errors.append((line, v['utr'], 'UTR already imported'))
+            else:
+                values.append(v)
+        if values:
+            db.session.execute(stmt, values)
+            inserted += len(values)
+    return {'inserted': inserted, 'errors': errors}
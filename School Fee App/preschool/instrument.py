@@ -0,0 +1,160 @@
+# preschool/instrument.py
+"""
+Per-request SQL and latency instrumentation.
+
+SQLAlchemy cursor events time every statement; statements run while a
+request is being handled are counted and timed on flask.g. When the request
+finishes, its latency, statement count, SQL time and slowest statement go
+into a bounded ring buffer (PERF_RECENT_REQUESTS), and statements slower
+than SLOW_QUERY_MS into a second one (PERF_SLOW_QUERIES). perf_snapshot()
+summarises both per route for /admin/perf; nothing is written to disk, so
+the buffers reset on restart.
+
+Views can also declare how many statements they are allowed with
+@query_budget(n); going over is an N+1 regression (usually a template
+touching a lazy relationship). Under app.testing, or with
+QUERY_BUDGET_STRICT=1, that raises QueryBudgetExceeded so the request
+fails loudly; otherwise it is logged as a warning. The count is also sent
+back as an X-Query-Count header.
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STATEMENT_CHARS = 400   # statements are kept truncated, never with parameters
+
+_recent = deque(maxlen=500)
+_slow = deque(maxlen=100)
+_lock = threading.Lock()
+_started = datetime.now()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+# ---------- SQLAlchemy hooks ----------
+
+# the start time lives on the statement's execution context, so a statement
+# that raises (and never reaches after_cursor_execute) leaves nothing behind
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is None:
+        return
+    ms = (time.perf_counter() - start) * 1000
+    if not has_request_context():
+        return
+    g.query_count = g.get('query_count', 0) + 1
+    g.query_ms = g.get('query_ms', 0.0) + ms
+    if ms > g.get('slowest_ms', -1.0):
+        g.slowest_ms, g.slowest_sql = ms, statement
+    if ms >= current_app.config.get('SLOW_QUERY_MS', 100):
+        with _lock:
+            _slow.append({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'endpoint': request.endpoint,
+                'ms': round(ms, 1),
+                'statement': _shorten(statement),
+            })
+
+def _shorten(statement):
+    statement = ' '.join((statement or '').split())
+    return statement if len(statement) <= STATEMENT_CHARS else statement[:STATEMENT_CHARS] + '…'
+
+# ---------- Flask hooks ----------
+
+def _start_request():
+    g.request_start = time.perf_counter()
+
+def _finish_request(response):
+    count = g.get('query_count', 0)
+    response.headers['X-Query-Count'] = str(count)
+    if request.endpoint != 'static' and 'request_start' in g:
+        with _lock:
+            _recent.append({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint or '(unmatched)',
+                'status': response.status_code,
+                'ms': round((time.perf_counter() - g.request_start) * 1000, 1),
+                'queries': count,
+                'sql_ms': round(g.get('query_ms', 0.0), 1),
+                'slowest_ms': round(g.get('slowest_ms', 0.0), 1),
+                'slowest_sql': _shorten(g.get('slowest_sql')),
+            })
+    _check_budget(count)
+    return response
+
+def query_budget(limit):
+    """Declare the most SQL statements a view may run per request."""
+    def decorator(fn):
+        fn.query_budget = limit
+        return fn
+    return decorator
+
+def _check_budget(count):
+    view = current_app.view_functions.get(request.endpoint)
+    limit = getattr(view, 'query_budget', None)
+    if limit is not None and count > limit:
+        msg = f'{request.endpoint} ran {count} SQL statements (budget {limit}) for {request.path}'
+        if current_app.testing or current_app.config.get('QUERY_BUDGET_STRICT'):
+            raise QueryBudgetExceeded(msg)
+        current_app.logger.warning(msg)
+
+def init_instrumentation(app):
+    global _recent, _slow
+    _recent = deque(_recent, maxlen=app.config.get('PERF_RECENT_REQUESTS', 500))
+    _slow = deque(_slow, maxlen=app.config.get('PERF_SLOW_QUERIES', 100))
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+# ---------- reading ----------
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+def perf_snapshot():
+    """Per-route summary of the recent requests, plus the raw buffers (newest first)."""
+    with _lock:
+        recent = list(_recent)
+        slow = list(_slow)
+    by_route = {}
+    for r in recent:
+        by_route.setdefault(r['endpoint'], []).append(r)
+    routes = []
+    for endpoint, rows in by_route.items():
+        ms = sorted(r['ms'] for r in rows)
+        routes.append({
+            'endpoint': endpoint,
+            'requests': len(rows),
+            'p50_ms': _percentile(ms, 50),
+            'p95_ms': _percentile(ms, 95),
+            'max_ms': ms[-1],
+            'avg_queries': round(sum(r['queries'] for r in rows) / len(rows), 1),
+            'max_queries': max(r['queries'] for r in rows),
+            'sql_share': round(sum(r['sql_ms'] for r in rows) / (sum(ms) or 1) * 100),
+        })
+    routes.sort(key=lambda r: r['p95_ms'] * r['requests'], reverse=True)
+    return {
+        'since': _started.isoformat(timespec='seconds'),
+        'routes': routes,
+        'recent': recent[::-1],
+        'slow_queries': slow[::-1],
+    }
+
+def reset_perf():
+    with _lock:
+        _recent.clear()
+        _slow.clear()
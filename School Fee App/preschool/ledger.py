@@ -0,0 +1,141 @@
+# preschool/ledger.py
+"""
+Denormalised per-student balances.
+
+Student.balance_amount and Student.credit_balance hold the two halves of a
+student's net position (see balances.py for the formula):
+
+    balance_amount = max(net, 0)      credit_balance = max(-net, 0)
+
+Every write path posts before its commit, so the columns move in the same
+transaction as the row: receipts, waivers and refunds through the apply_*
+helpers, fee assignments in bulk through post_where() / post_many(). reconcile() recomputes them from the ledger tables in bulk and is exposed
+as `flask ledger reconcile`.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, case, update, bindparam
+from .extensions import db
+from .models import Student
+from .cache import touch
+from .utils import D
+
+ledger_cli = AppGroup('ledger', help='Student balance ledger maintenance.')
+
+# ---------- incremental updates ----------
+
+def _split(net):
+    return {
+        'balance_amount': case((net > 0, net), else_=0),
+        'credit_balance': case((net < 0, -net), else_=0),
+    }
+
+def post(student_id, delta):
+    """Move a student's net position by `delta` (positive = owes more).
+
+    Done as a single UPDATE so concurrent posts for the same student can't
+    lose each other's changes.
+    """
+    delta = D(delta or 0)
+    if not student_id or delta == 0:
+        return
+    net = func.coalesce(Student.balance_amount, 0) - func.coalesce(Student.credit_balance, 0) + delta
+    db.session.execute(
+        update(Student).where(Student.id == student_id).values(**_split(net)),
+        execution_options={'synchronize_session': 'fetch'},
+    )
+    touch(db.session, 'balances')
+
+def post_where(delta, *criteria):
+    """Move the net position of every student matching `criteria` by `delta`.
+
+    One UPDATE for the whole set; used by bulk operations that charge a
+    cohort the same amount.
+    """
+    delta = D(delta or 0)
+    if delta == 0:
+        return 0
+    net = func.coalesce(Student.balance_amount, 0) - func.coalesce(Student.credit_balance, 0) + delta
+    result = db.session.execute(
+        update(Student).where(*criteria).values(**_split(net)),
+        execution_options={'synchronize_session': False},
+    )
+    touch(db.session, 'balances')
+    return result.rowcount
+
+def post_many(deltas):
+    """post() for many students at once: {student_id: delta}, one executemany UPDATE."""
+    params = [{'sid': sid, 'delta': D(delta)} for sid, delta in deltas.items() if sid and delta]
+    if not params:
+        return
+    t = Student.__table__
+    net = func.coalesce(t.c.balance_amount, 0) - func.coalesce(t.c.credit_balance, 0) + bindparam('delta', type_=t.c.balance_amount.type)
+    db.session.execute(update(t).where(t.c.id == bindparam('sid')).values(**_split(net)), params)
+    touch(db.session, 'balances')
+
+def apply_receipt(rec):
+    post(rec.student_id, -D(rec.amount or 0))
+
+def apply_waiver(w):
+    post(w.student_id, -D(w.amount or 0))
+
+def apply_refund(r):
+    post(r.student_id, D(r.amount or 0))
+
+# ---------- bulk rebuild / verification ----------
+
+def _expected(net):
+    net = D(net or 0)
+    return (net if net > 0 else D(0)), (-net if net < 0 else D(0))
+
+def reconcile(student_ids=None, fix=False):
+    """Compare persisted balances with the ledger tables.
+
+    Returns [(student_id, (stored_balance, stored_credit), (expected_balance,
+    expected_credit))] for every mismatch. With fix=True the mismatching rows
+    are rewritten with one executemany UPDATE; the caller commits.
+    """
+    from .balances import balance_query
+    ids = None
+    if student_ids is not None:
+        ids = list(student_ids)
+        if not ids:
+            return []
+    q = balance_query(student_ids=ids,
+                      entities=(Student.id, Student.balance_amount, Student.credit_balance))
+
+    mismatches = []
+    for row in q:
+        stored = (D(row.balance_amount or 0), D(row.credit_balance or 0))
+        expected = _expected(row.balance)
+        if stored != expected:
+            mismatches.append((row.id, stored, expected))
+
+    if fix and mismatches:
+        db.session.execute(
+            update(Student),
+            [{'id': sid, 'balance_amount': bal, 'credit_balance': cr} for sid, _, (bal, cr) in mismatches],
+        )
+        touch(db.session, 'balances')
+    return mismatches
+
+def rebuild_balances(student_ids=None):
+    """Recompute persisted balances for the given students (or everyone)."""
+    return len(reconcile(student_ids, fix=True))
+
+@ledger_cli.command('reconcile')
+@click.option('--fix', is_flag=True, help='Rewrite mismatching balances.')
+@click.option('--verbose', '-v', is_flag=True, help='List every mismatch.')
+def reconcile_command(fix, verbose):
+    """Verify (and optionally rebuild) every student's persisted balance."""
+    mismatches = reconcile(fix=fix)
+    if verbose:
+        for sid, (bal, cr), (ebal, ecr) in mismatches:
+            click.echo(f'student {sid}: stored {bal}/{cr} expected {ebal}/{ecr}')
+    if fix:
+        db.session.commit()
+        click.echo(f'Rebuilt {len(mismatches)} balance(s).')
+    else:
+        click.echo(f'{len(mismatches)} mismatched balance(s).')
+    if mismatches and not fix:
+        raise SystemExit(1)
@@ -29,6 +29,12 @@ class SystemSetting(db.Model):
     key = db.Column(db.String(80), unique=True, nullable=False)
     value = db.Column(db.String(400))
 
+class ReceiptSequence(db.Model):
+    """Receipt counters, one row per academic year; see utils.next_receipt_no()."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(40), unique=True, nullable=False)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
 # ADDED: The missing AcademicYear model
 class AcademicYear(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,8 +49,38 @@ class FeeType(db.Model):
     name = db.Column(db.String(120), unique=True, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
 
+class FeePlan(db.Model):
+    """A fee type billed as a schedule of installments (terms, months...)."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False)
+    fee_type_id = db.Column(db.Integer, db.ForeignKey('fee_type.id'), nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    fee_type = db.relationship("FeeType")
+    installments = db.relationship("FeePlanInstallment", backref="plan", cascade="all, delete-orphan",
+                                   order_by="FeePlanInstallment.seq")
+
+    def total(self):
+        from decimal import Decimal
+        return sum((i.amount or 0) for i in self.installments) or Decimal(0)
+
+class FeePlanInstallment(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('plan_id', 'seq', name='uq_fee_plan_installment_seq'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    plan_id = db.Column(db.Integer, db.ForeignKey('fee_plan.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    label = db.Column(db.String(60))
+    due_date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Numeric(12, 2), default=0)
+
 # ---------------- Students ----------------
 class Student(db.Model):
+    __table_args__ = (
+        db.Index('ix_student_class_section', 'class_name', 'section'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     admission_no = db.Column(db.String(40), unique=True)
     name = db.Column(db.String(120), nullable=False)
@@ -55,8 +91,10 @@ class Student(db.Model):
     email = db.Column(db.String(120)) # Added email
     discontinued = db.Column(db.Date)      # null => active
     collectible = db.Column(db.Boolean)     # if discontinued and collectible = True => show in collectible report
-    balance_amount = db.Column(db.Numeric(12, 2), default=0) # Added balance_amount
-    credit_balance = db.Column(db.Numeric(12, 2), default=0) # Added credit_balance
+    opening_balance = db.Column(db.Numeric(12, 2), default=0) # carried in from the previous system/year
+    opening_credit = db.Column(db.Numeric(12, 2), default=0)
+    balance_amount = db.Column(db.Numeric(12, 2), default=0) # maintained by ledger.py
+    credit_balance = db.Column(db.Numeric(12, 2), default=0) # maintained by ledger.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     fees = db.relationship("StudentFee", backref="student", cascade="all, delete-orphan")
@@ -76,19 +114,45 @@ class Student(db.Model):
         return Decimal(amt)
 
     def balance(self):
+        """Outstanding amount, as kept up to date by ledger.post()."""
         from decimal import Decimal
-        return Decimal(self.total_receivable()) - Decimal(self.total_received())
+        return Decimal(self.balance_amount or 0)
 
 class StudentFee(db.Model):
+    __table_args__ = (
+        db.Index('ix_student_fee_student', 'student_id', 'fee_type_id'),
+        db.Index('ix_student_fee_due', 'due_date', 'student_id'),
+        db.Index('uq_student_fee_installment', 'student_id', 'installment_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     fee_type_id = db.Column(db.Integer, db.ForeignKey('fee_type.id'), nullable=False)
     amount = db.Column(db.Numeric(12, 2), default=0)
+    due_date = db.Column(db.Date)  # null => due immediately
+    plan_id = db.Column(db.Integer, db.ForeignKey('fee_plan.id'))
+    installment_id = db.Column(db.Integer, db.ForeignKey('fee_plan_installment.id'))
 
     fee_type = db.relationship("FeeType")
 
+class StudentPlan(db.Model):
+    """Which students a fee plan has been assigned to."""
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'plan_id', name='uq_student_plan'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('fee_plan.id'), nullable=False)
+    assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    plan = db.relationship("FeePlan")
+
 # ---------------- Receipts ----------------
 class Receipt(db.Model):
+    __table_args__ = (
+        db.Index('ix_receipt_student', 'student_id', 'created_at'),
+        db.Index('ix_receipt_created', 'created_at'),
+        db.Index('ix_receipt_mode_created', 'mode', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     receipt_no = db.Column(db.String(40), unique=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
@@ -101,6 +165,10 @@ class Receipt(db.Model):
     items = db.relationship("ReceiptItem", backref="receipt", cascade="all, delete-orphan")
 
 class ReceiptItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_receipt_item_receipt', 'receipt_id'),
+        db.Index('ix_receipt_item_fee_type', 'fee_type_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     receipt_id = db.Column(db.Integer, db.ForeignKey('receipt.id'), nullable=False)
     fee_type_id = db.Column(db.Integer, db.ForeignKey('fee_type.id'), nullable=False)
@@ -109,6 +177,9 @@ class ReceiptItem(db.Model):
 
 # ---------------- Waivers / Refunds ----------------
 class Waiver(db.Model):
+    __table_args__ = (
+        db.Index('ix_waiver_student', 'student_id', 'fee_type_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'))
     fee_type_id = db.Column(db.Integer, db.ForeignKey('fee_type.id'))
@@ -121,6 +192,10 @@ class Waiver(db.Model):
 
 # ADDED: The missing Refund model
 class Refund(db.Model):
+    __table_args__ = (
+        db.Index('ix_refund_student', 'student_id'),
+        db.Index('ix_refund_created', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     refund_no = db.Column(db.String(40), unique=True, nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
@@ -142,6 +217,28 @@ class CashCount(db.Model):
     notes = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class CollectionDaily(db.Model):
+    """Receipts per day and mode; maintained by rollups.record_receipt()."""
+    __table_args__ = (
+        db.UniqueConstraint('day', 'mode', name='uq_collection_daily_day_mode'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    mode = db.Column(db.String(20))
+    amount = db.Column(db.Numeric(12,2), default=0)
+    count = db.Column(db.Integer, default=0)
+
+class IncomeDaily(db.Model):
+    """Receipt items per day, fee type and mode; maintained by rollups.record_receipt()."""
+    __table_args__ = (
+        db.UniqueConstraint('day', 'fee_type_id', 'mode', name='uq_income_daily_day_fee_mode'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    fee_type_id = db.Column(db.Integer, db.ForeignKey('fee_type.id'), nullable=False)
+    mode = db.Column(db.String(20))
+    amount = db.Column(db.Numeric(12,2), default=0)
+
 class PhonePeFeeRule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), unique=True, nullable=False)
@@ -150,6 +247,9 @@ class PhonePeFeeRule(db.Model):
     active = db.Column(db.Boolean, default=True) # Added active
 
 class SettlementBatch(db.Model):
+    __table_args__ = (
+        db.Index('ix_settlement_batch_period', 'start_date', 'end_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     provider = db.Column(db.String(40))  # "UPI"
     start_date = db.Column(db.Date, nullable=False)
@@ -161,11 +261,30 @@ class SettlementBatch(db.Model):
     expected_net = db.Column(db.Numeric(12,2), default=0)
     bank_net = db.Column(db.Numeric(12,2), default=0)
     variance = db.Column(db.Numeric(12,2), default=0)
+    status = db.Column(db.String(20), default='Open')  # Open / Matched / Variance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     rule = db.relationship("PhonePeFeeRule")
 
+class BankCredit(db.Model):
+    """One credit line from a bank statement; batch_id once it is mapped to a settlement."""
+    __table_args__ = (
+        # lines imported before UTRs were unique keep theirs, marked duplicate_of
+        db.Index('uq_bank_credit_utr', 'utr', unique=True, sqlite_where=db.text('duplicate_of IS NULL')),
+        db.Index('ix_bank_credit_batch', 'batch_id', 'date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    amount_net = db.Column(db.Numeric(12,2), default=0)
+    utr = db.Column(db.String(64))
+    batch_id = db.Column(db.Integer, db.ForeignKey('settlement_batch.id'))
+    duplicate_of = db.Column(db.Integer)  # first line with the same UTR (legacy repeats only)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # ADDED: AuditLog model, which was used but not defined
 class AuditLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_audit_log_created', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     actor = db.Column(db.String(80))
     action = db.Column(db.String(40))
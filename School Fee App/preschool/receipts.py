@@ -2,17 +2,22 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from datetime import datetime
+from sqlalchemy.orm import joinedload, selectinload
 from .extensions import db
-from .models import Student, FeeType, Receipt, ReceiptItem
+from .models import FeeType, Receipt, ReceiptItem
 # MODIFIED: Correctly importing the updated utility functions
 from .utils import D, next_receipt_no, get_active_year_name
+from .ledger import apply_receipt
+from .rollups import record_receipt
+from .instrument import query_budget
 
 receipts_bp = Blueprint('receipts', __name__)
 
 @receipts_bp.route('/', methods=['GET'])
 @login_required
+@query_budget(4)
 def list_receipts():
-    rows = Receipt.query.order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(200).all()
+    rows = Receipt.query.options(joinedload(Receipt.student)).order_by(Receipt.created_at.desc(), Receipt.id.desc()).limit(200).all()
     return render_template('receipts/list.html', rows=rows)
 
 @receipts_bp.route('/new', methods=['GET', 'POST'])
@@ -24,14 +29,6 @@ def new_receipt():
             mode = request.form.get('mode') or 'Cash'
             notes = request.form.get('notes') or ''
 
-            rec_no = next_receipt_no() # This will be None if mode is manual
-            if rec_no is None:
-                rec_no = (request.form.get('receipt_no') or '').strip()
-                if not rec_no:
-                    flash('Receipt number is required in manual numbering mode.', 'danger')
-                    return redirect(url_for('receipts.new_receipt'))
-
-            # Start transaction
             total = D(0)
             items_to_add = []
             for ft in FeeType.query.order_by(FeeType.name.asc()).all():
@@ -47,14 +44,24 @@ def new_receipt():
             if total == 0:
                 flash('Please enter at least one amount.', 'warning')
                 return redirect(url_for('receipts.new_receipt'))
-            
+
+            # First write of the transaction: the number commits (or rolls back) with the receipt
+            rec_no = next_receipt_no() # This will be None if mode is manual
+            if rec_no is None:
+                rec_no = (request.form.get('receipt_no') or '').strip()
+                if not rec_no:
+                    flash('Receipt number is required in manual numbering mode.', 'danger')
+                    return redirect(url_for('receipts.new_receipt'))
+
             rec = Receipt(receipt_no=rec_no, student_id=student_id, mode=mode, amount=total,
                           notes=notes, created_by=current_user.username, created_at=datetime.utcnow())
             db.session.add(rec)
             db.session.flush()  # get id for receipt items
 
-            for item_data in items_to_add:
-                db.session.add(ReceiptItem(receipt_id=rec.id, **item_data))
+            items = [ReceiptItem(receipt_id=rec.id, **item_data) for item_data in items_to_add]
+            db.session.add_all(items)
+            apply_receipt(rec)
+            record_receipt(rec, items)
 
             db.session.commit()
             flash('Receipt created.', 'success')
@@ -70,12 +77,16 @@ def new_receipt():
             return redirect(url_for('receipts.new_receipt'))
 
 
-    students = Student.query.order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc()).all()
+    # students are picked through the /students/search typeahead
     fee_types = FeeType.query.order_by(FeeType.name.asc()).all()
-    return render_template('receipts/new.html', students=students, fee_types=fee_types, active_year=get_active_year_name())
+    return render_template('receipts/new.html', fee_types=fee_types, active_year=get_active_year_name())
 
 @receipts_bp.route('/<int:receipt_id>/print', methods=['GET'])
 @login_required
+@query_budget(4)
 def print_receipt(receipt_id: int):
-    rec = Receipt.query.get_or_404(receipt_id)
+    rec = (Receipt.query
+           .options(joinedload(Receipt.student),
+                    selectinload(Receipt.items).joinedload(ReceiptItem.fee_type))
+           .filter_by(id=receipt_id).first_or_404())
     return render_template('receipts/print.html', rec=rec)
\ No newline at end of file
@@ -3,9 +3,13 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta
 from .extensions import db
-from .models import CashCount, Receipt, SettlementBatch, PhonePeFeeRule
+from .models import CashCount, SettlementBatch, PhonePeFeeRule, BankCredit
 from .security import role_required, audit
 from .utils import D
+from .rollups import collected, UPI_MODES
+from .imports import read_csv, import_bank_credits
+from .settlements import (MATCH_DAYS, MATCH_AMOUNT, open_batches, unmapped_credits,
+                          map_credits, match_credits, settlement_charges, generate_batches, default_rule)
 
 recon_bp = Blueprint('recon', __name__)
 
@@ -47,11 +51,7 @@ def cash_submit():
     counted = D(request.form.get('amount_counted') or 0)
     notes = request.form.get('notes') or ''
 
-    cash_total = db.session.query(db.func.coalesce(db.func.sum(Receipt.amount), 0)).filter(
-        db.func.date(Receipt.created_at) == d,
-        Receipt.mode == 'Cash'
-    ).scalar() or 0
-    cash_total = D(cash_total)
+    cash_total = collected(d, modes=['Cash'])
 
     variance = counted - cash_total
 
@@ -75,25 +75,10 @@ def settlements_new():
     rid = request.form.get('rule_id')
     rule = PhonePeFeeRule.query.get(int(rid)) if (rid and rid.strip()) else None
 
-    receipts_total = db.session.query(db.func.coalesce(db.func.sum(Receipt.amount), 0)).filter(
-        db.func.date(Receipt.created_at) >= start,
-        db.func.date(Receipt.created_at) <= end,
-        Receipt.mode.in_(['UPI', 'UPI-PhonePe', 'UPI-GPay', 'UPI-Paytm', 'UPI-Other'])
-    ).scalar() or 0
-    receipts_total = D(receipts_total)
-
-    override_pct = request.form.get('override_percent')
-    override_flat = request.form.get('override_flat')
-    charges = D(0)
-    if override_pct:
-        charges += (receipts_total * D(override_pct)) / D(100)
-    if override_flat:
-        charges += D(override_flat)
-    if charges == 0 and rule is not None:
-        if getattr(rule, 'percent', None):
-            charges += (receipts_total * D(rule.percent)) / D(100)
-        if getattr(rule, 'flat', None):
-            charges += D(rule.flat)
+    receipts_total = collected(start, end, modes=UPI_MODES)
+
+    charges = settlement_charges(receipts_total, rule, request.form.get('override_percent'),
+                                 request.form.get('override_flat'))
 
     expected_net = receipts_total - charges
     bank_net = D(request.form.get('bank_amount') or 0)
@@ -114,3 +99,111 @@ def settlements_new():
 
     flash('UPI settlement saved.', 'success')
     return redirect(url_for('recon.home') + '#upi')
+
+
+@recon_bp.route('/settlements/generate', methods=['POST'], endpoint='settlements_generate')
+@role_required(['Owner', 'Manager'])
+def settlements_generate():
+    """One batch per `days`-long window from start to end; re-running recomputes them."""
+    try:
+        start = datetime.strptime(request.form['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.form['end'], '%Y-%m-%d').date()
+        days = int(request.form.get('days') or 1)
+    except (KeyError, ValueError):
+        flash('Enter a start date, an end date and the days per batch.', 'danger')
+        return redirect(url_for('recon.home') + '#upi')
+    if end < start or days < 1:
+        flash('End date must be on or after the start date.', 'danger')
+        return redirect(url_for('recon.home') + '#upi')
+
+    rid = request.form.get('rule_id')
+    rule = PhonePeFeeRule.query.get(int(rid)) if (rid and rid.strip()) else default_rule()
+    result = generate_batches(start, end, days, rule, request.form.get('override_percent'),
+                              request.form.get('override_flat'))
+    matched = match_credits()
+    db.session.commit()
+
+    audit(actor=current_user.username, action='CREATE', table='settlement_batch', record_id='-',
+          before=None, after={'start': str(start), 'end': str(end), 'days': days,
+                              'created': result['created'], 'updated': result['updated']},
+          reason='upi settlement generation')
+    msg = f"{result['created']} batch(es) created, {result['updated']} recomputed, {matched} matched to bank credits."
+    if result['skipped']:
+        first = result['skipped'][0]
+        flash(f"{msg} {len(result['skipped'])} window(s) skipped because they overlap a batch with "
+              f"different dates (first: {first[0]} → {first[1]}).", 'warning')
+    else:
+        flash(msg, 'success')
+    return redirect(url_for('recon.home') + '#upi')
+
+# --- Bank statement credits ---------------------------------------------------
+
+@recon_bp.route('/bank-import', methods=['GET', 'POST'], endpoint='bank_import')
+@role_required(['Owner', 'Manager'])
+def bank_import():
+    if request.method == 'POST':
+        f = request.files.get('csv')
+        if not f:
+            flash('Upload a CSV file', 'warning')
+            return redirect(url_for('recon.bank_import'))
+        try:
+            result = import_bank_credits(read_csv(f))
+            matched = match_credits()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Import failed: {e}', 'danger')
+            return redirect(url_for('recon.bank_import'))
+        count, errors = result['inserted'], result['errors']
+        audit(actor=current_user.username, action='IMPORT', table='bank_credit', record_id='-', before={},
+              after={'count': count, 'rejected': len(errors), 'matched': matched})
+        summary = f'{count} credit(s) imported, {matched} settlement(s) matched.'
+        if not errors:
+            flash(summary, 'success')
+            return redirect(url_for('recon.bank_import'))
+        flash(f'{summary} {len(errors)} row(s) rejected', 'warning')
+        return render_template('students/import_report.html', title='Bank Statement Import',
+                               summary=summary, errors=errors, key_label='UTR',
+                               back_url=url_for('recon.bank_import'))
+
+    credits = unmapped_credits().order_by(BankCredit.date.desc(), BankCredit.id.desc()).limit(500).all()
+    batches = open_batches().order_by(SettlementBatch.start_date.desc(), SettlementBatch.id.desc()).limit(200).all()
+    return render_template('recon/bank_import.html', credits=credits, batches=batches,
+                           unmapped=unmapped_credits().count(), match_days=MATCH_DAYS, match_amount=MATCH_AMOUNT)
+
+@recon_bp.route('/settlements/<int:batch_id>/map', methods=['POST'], endpoint='settlements_map')
+@role_required(['Owner', 'Manager'])
+def settlements_map(batch_id):
+    batch = SettlementBatch.query.get_or_404(batch_id)
+    try:
+        ids = sorted({int(c) for c in request.form.getlist('credit_id')})
+    except ValueError:
+        flash('Invalid credit selection', 'danger')
+        return redirect(url_for('recon.bank_import'))
+    if not ids:
+        flash('Select at least one credit', 'warning')
+        return redirect(url_for('recon.bank_import'))
+    credits = BankCredit.query.filter(BankCredit.id.in_(ids)).all()
+    if len(credits) != len(ids):
+        flash('Some of the selected credits no longer exist; nothing was mapped.', 'danger')
+        return redirect(url_for('recon.bank_import'))
+    n = map_credits(batch, credits)
+    db.session.commit()
+    audit(actor=current_user.username, action='UPDATE', table='settlement_batch', record_id=str(batch.id),
+          before=None, after={'credits': ids, 'bank_net': float(batch.bank_net or 0)}, reason='map bank credits')
+    flash(f'Mapped {n} credit(s); batch is {batch.status}.', 'success')
+    return redirect(url_for('recon.bank_import'))
+
+@recon_bp.route('/settlements/match', methods=['POST'], endpoint='settlements_match')
+@role_required(['Owner', 'Manager'])
+def settlements_match():
+    try:
+        days = int(request.form.get('days') or MATCH_DAYS)
+        tolerance = D(request.form.get('amount_tolerance') or MATCH_AMOUNT)
+    except Exception:
+        flash('Invalid matching tolerance', 'danger')
+        return redirect(url_for('recon.bank_import'))
+    matched = match_credits(days, tolerance)
+    db.session.commit()
+    flash(f'Matched {matched} settlement(s).', 'success' if matched else 'info')
+    return redirect(url_for('recon.bank_import'))
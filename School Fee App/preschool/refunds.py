@@ -6,6 +6,7 @@ from .extensions import db
 from .models import Student, Refund, FeeType
 from .security import role_required, audit
 from .utils import D
+from .ledger import apply_refund
 
 refunds_bp = Blueprint('refunds', __name__)
 
@@ -16,8 +17,6 @@ def next_refund_no():
 @refunds_bp.route('/new', methods=['GET','POST'])
 @role_required(['Owner','Manager'])
 def new_refund():
-    students = Student.query.order_by(Student.name.asc()).all()
-    fee_types = FeeType.query.order_by(FeeType.name.asc()).all()
     if request.method == 'POST':
         try:
             # ADDED: Input validation
@@ -46,7 +45,7 @@ def new_refund():
             r = Refund(refund_no=next_refund_no(), student_id=student_id, fee_type_id=fee_type_id, mode=mode, amount=amount, reason=reason, created_by=current_user.username)
             if custom_dt: r.created_at = custom_dt
             db.session.add(r)
-            s.credit_balance = (s.credit_balance or D(0)) - amount
+            apply_refund(r)
             db.session.commit()
             audit(current_user.username,'CREATE','refund',r.id,{}, {'amount':str(amount),'reason':reason})
             flash(f'Refund {r.refund_no} saved','success')
@@ -57,4 +56,5 @@ def new_refund():
         return redirect(url_for('refunds.new_refund'))
         
     rows = Refund.query.order_by(Refund.created_at.desc()).limit(200).all()
-    return render_template('receipts/refunds.html', rows=rows, students=students, fee_types=fee_types)
\ No newline at end of file
+    fee_types = FeeType.query.order_by(FeeType.name.asc()).all()
+    return render_template('receipts/refunds.html', rows=rows, fee_types=fee_types)
\ No newline at end of file
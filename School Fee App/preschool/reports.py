@@ -1,16 +1,22 @@
 # preschool/reports.py
-from flask import Blueprint, render_template, request, Response
+from flask import Blueprint, render_template, request
 from flask_login import login_required
-from sqlalchemy import func, or_, and_, true
-from datetime import datetime
-from .extensions import db
-from .models import Student, Receipt, ReceiptItem, FeeType
-from .utils import D, receivable_for_student, received_for_student
+from sqlalchemy import or_, and_, true
+from datetime import datetime, date
+from .models import Student
+from .utils import D
+from .balances import (balance_totals, student_balances, balance_rows,
+                       overdue_query, overdue_balances, overdue_count)
+from .rollups import income_by_fee_type, income_modes
+from .aging import BUCKETS, COLUMNS as AGING_COLUMNS, aging_frame, aging_by_class, aging_totals
+from .exports import csv_response, stream, money
 
 reports_bp = Blueprint("reports", __name__)
 
 # --------------------------- helpers -----------------------------------------
 
+ROSTER_ORDER = (Student.class_name.asc(), Student.section.asc(), Student.name.asc())
+
 def has_col(model, name: str) -> bool:
     """Return True if ORM model has a DB column with this name."""
     try:
@@ -18,206 +24,167 @@ def has_col(model, name: str) -> bool:
     except Exception:
         return False
 
-def _student_balance(student_id: int) -> D:
-    """Receivable - Received for a student, Decimal (>= 0)."""
-    rcv = receivable_for_student(student_id) or D(0)
-    rec = received_for_student(student_id) or D(0)
-    bal = rcv - rec
-    return bal if bal > D(0) else D(0)
-
-def _rows_with_balance(q):
-    """Return [(student, balance>0)] sorted desc by balance."""
-    rows = []
-    for s in q:
-        bal = _student_balance(s.id)
-        if bal > D(0):
-            rows.append((s, bal))
-    rows.sort(key=lambda t: t[1], reverse=True)
-    return rows
-
-# --------------------------- pages -------------------------------------------
+def _collectible_col():
+    """`collectible`, or legacy `collectible_after_discontinue`, if the schema has one."""
+    for name in ("collectible", "collectible_after_discontinue"):
+        if has_col(Student, name):
+            return getattr(Student, name)
+    return None
+
+def _active_cond():
+    """Active students (discontinued date is null)."""
+    if has_col(Student, "discontinued"):
+        return Student.discontinued.is_(None)
+    return true()
+
+def _discontinued_cond(collectible: bool):
+    """Discontinued students with the given collectible flag, or None if unsupported."""
+    col = _collectible_col()
+    if not has_col(Student, "discontinued") or col is None:
+        return None
+    flag = (col == True) if collectible else or_(col == False, col.is_(None))
+    return and_(Student.discontinued.isnot(None), flag)
+
+def _overdue_cond():
+    """Active students, plus discontinued & collectible ones when the schema allows."""
+    cond = _discontinued_cond(True)
+    return or_(_active_cond(), cond) if cond is not None else _active_cond()
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    except ValueError:
+        return None
 
-@reports_bp.route("/summary")
-@login_required
-def summary():
-    students = Student.query.order_by(Student.name.asc()).all()
+def _as_of():
+    """?as_of=YYYY-MM-DD for due-date based reports, default today."""
+    return _parse_day(request.args.get("as_of")) or date.today()
 
-    total_students = len(students)
-    receivable_sum = D(0)
-    received_sum = D(0)
-    overdue_rows = []
+def _income_args():
+    """(from, to, mode) query args for the income report; dates are inclusive."""
+    return request.args.get("from"), request.args.get("to"), request.args.get("mode") or None
 
-    has_discontinued = has_col(Student, "discontinued")
-    # support either `collectible` or legacy `collectible_after_discontinue`
-    collectible_col = "collectible" if has_col(Student, "collectible") else (
-        "collectible_after_discontinue" if has_col(Student, "collectible_after_discontinue") else None
-    )
+def _aging_args():
+    """(as_of, class_name, criteria) for the aging report."""
+    class_name = request.args.get("class_name") or None
+    criteria = [_overdue_cond()]
+    if class_name:
+        criteria.append(Student.class_name == class_name)
+    return _as_of(), class_name, criteria
 
-    for s in students:
-        rcv = receivable_for_student(s.id) or D(0)
-        rec = received_for_student(s.id) or D(0)
-        bal = rcv - rec
-        receivable_sum += rcv
-        received_sum += rec
+AGING_STUDENTS_SHOWN = 200
 
-        is_active = True
-        if has_discontinued:
-            is_active = not bool(getattr(s, "discontinued") or False)
+BALANCE_CSV_HEADER = ("Admission No", "Name", "Class", "Section", "Phone", "Receivable")
 
-        is_collectible = False
-        if collectible_col:
-            is_collectible = bool(getattr(s, collectible_col) or False)
+def _balance_csv(filename, query):
+    rows = ((*row[:-1], money(row[-1])) for row in stream(query)) if query is not None else ()
+    return csv_response(filename, BALANCE_CSV_HEADER, rows)
 
-        if bal > D(0) and (is_active or is_collectible):
-            overdue_rows.append((s, bal))
+# --------------------------- pages -------------------------------------------
 
-    overdue_rows.sort(key=lambda t: t[1], reverse=True)
-    top_overdue = overdue_rows[:10]
-    overdue_count = len(overdue_rows)
-    balance_sum = receivable_sum - received_sum
+@reports_bp.route("/summary")
+@login_required
+def summary():
+    today = date.today()
+    totals = balance_totals()
+    top_overdue = overdue_balances(_overdue_cond(), as_of=today, limit=10)
 
     return render_template(
         "reports/summary.html",
-        total_students=total_students,
-        receivable_sum=receivable_sum,
-        received_sum=received_sum,
-        balance_sum=balance_sum,
-        overdue_count=overdue_count,
+        total_students=totals["students"],
+        receivable_sum=totals["receivable"],
+        received_sum=totals["received"],
+        balance_sum=totals["balance"],
+        overdue_count=overdue_count(_overdue_cond(), as_of=today),
         top_overdue=top_overdue,
     )
 
 @reports_bp.route("/overdue")
 @login_required
 def overdue():
-    """Students with positive receivable:
+    """Students owing fees that are due by ?as_of (default today):
        - Always include active students.
        - If the schema has (discontinued, collectible), also include discontinued & collectible.
     """
-    has_discontinued = has_col(Student, "discontinued")
-    collectible_attr = "collectible" if has_col(Student, "collectible") else (
-        "collectible_after_discontinue" if has_col(Student, "collectible_after_discontinue") else None
-    )
-
-    cond_active = true()
-    if has_discontinued:
-        cond_active = or_(Student.discontinued == False, Student.discontinued.is_(None))
-
-    if has_discontinued and collectible_attr:
-        cond_collectible = and_(Student.discontinued == True, getattr(Student, collectible_attr) == True)
-        base_q = Student.query.filter(or_(cond_active, cond_collectible))
-    else:
-        base_q = Student.query.filter(cond_active)
-
-    q = base_q.order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc())
-    rows = _rows_with_balance(q)
-    return render_template("reports/overdue.html", rows=rows)
+    as_of = _as_of()
+    rows = overdue_balances(_overdue_cond(), as_of=as_of)
+    return render_template("reports/overdue.html", rows=rows, as_of=as_of)
 
 @reports_bp.route("/overdue.csv")
 @login_required
 def overdue_csv():
-    has_discontinued = has_col(Student, "discontinued")
-    collectible_attr = "collectible" if has_col(Student, "collectible") else (
-        "collectible_after_discontinue" if has_col(Student, "collectible_after_discontinue") else None
-    )
-    cond_active = true()
-    if has_discontinued:
-        cond_active = or_(Student.discontinued == False, Student.discontinued.is_(None))
-    if has_discontinued and collectible_attr:
-        cond_collectible = and_(Student.discontinued == True, getattr(Student, collectible_attr) == True)
-        base_q = Student.query.filter(or_(cond_active, cond_collectible))
-    else:
-        base_q = Student.query.filter(cond_active)
-
-    q = base_q.order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc())
-    rows = [(s, _student_balance(s.id)) for s in q if _student_balance(s.id) > D(0)]
+    cols = (Student.admission_no, Student.name, Student.class_name, Student.section, Student.phone)
+    return _balance_csv("overdue.csv", overdue_query(_overdue_cond(), as_of=_as_of(), entities=cols,
+                                                     order_by=ROSTER_ORDER))
 
-    def gen():
-        yield "Admission No,Name,Class,Section,Phone,Receivable\n"
-        for s, bal in rows:
-            yield f"{s.admission_no or ''},{s.name or ''},{s.class_name or ''},{s.section or ''},{s.phone or ''},{float(bal):.2f}\n"
+@reports_bp.route("/aging")
+@login_required
+def aging():
+    """Receivables aged 0–30 / 31–60 / 61–90 / 90+ days, by class and by student."""
+    as_of, class_name, criteria = _aging_args()
+    frame = aging_frame(*criteria, as_of=as_of)
+    classes = [c for (c,) in Student.query.with_entities(Student.class_name).distinct()
+               .order_by(Student.class_name) if c]
+    return render_template(
+        "reports/aging.html",
+        as_of=as_of, class_name=class_name, classes=classes, buckets=BUCKETS,
+        totals=aging_totals(frame),
+        by_class=aging_by_class(frame).itertuples(index=False),
+        students=frame.head(AGING_STUDENTS_SHOWN).itertuples(index=False),
+        student_count=len(frame), shown=min(len(frame), AGING_STUDENTS_SHOWN),
+    )
 
-    return Response(gen(), mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment; filename=overdue.csv"})
+@reports_bp.route("/aging.csv")
+@login_required
+def aging_csv():
+    """?view=student (default) or class."""
+    as_of, class_name, criteria = _aging_args()
+    frame = aging_frame(*criteria, as_of=as_of)
+    amounts = ("Not Due", *(label for _, label, *_ in BUCKETS), "Overdue")
+    if request.args.get("view") == "class":
+        rows = aging_by_class(frame)[["class_name", "section", "students", *AGING_COLUMNS]]
+        header = ("Class", "Section", "Students", *amounts)
+        name = "aging_by_class.csv"
+    else:
+        rows = frame[["admission_no", "name", "class_name", "section", "phone", *AGING_COLUMNS]]
+        header = ("Admission No", "Name", "Class", "Section", "Phone", *amounts)
+        name = "aging.csv"
+    n = len(AGING_COLUMNS)
+    return csv_response(name, header, ((*r[:-n], *map(money, r[-n:]))
+                                       for r in rows.itertuples(index=False, name=None)))
 
 @reports_bp.route("/income")
 @login_required
 def income():
-    """Income by Fee Type (sum of receipt items)."""
-    date_from = request.args.get("from")
-    date_to = request.args.get("to")
-
-    ri = db.session.query(
-        FeeType.name.label("fee_name"),
-        func.sum(ReceiptItem.amount).label("amount"),
-    ).join(FeeType, FeeType.id == ReceiptItem.fee_type_id)
-
-    if date_from:
-        try:
-            ri = ri.filter(ReceiptItem.created_at >= datetime.strptime(date_from, "%Y-%m-%d"))
-        except Exception:
-            pass
-    if date_to:
-        try:
-            ri = ri.filter(ReceiptItem.created_at < datetime.strptime(date_to, "%Y-%m-%d"))
-        except Exception:
-            pass
-
-    rows = ri.group_by(FeeType.name).order_by(FeeType.name.asc()).all()
+    """Income by Fee Type (sum of receipt items), read from the daily rollup."""
+    date_from, date_to, mode = _income_args()
+    rows = income_by_fee_type(_parse_day(date_from), _parse_day(date_to), [mode] if mode else None)
     total = D(sum((r.amount or 0) for r in rows))
     return render_template("reports/income.html", rows=rows, total=total,
-                           date_from=date_from, date_to=date_to)
+                           date_from=date_from, date_to=date_to, mode=mode, modes=income_modes())
 
 @reports_bp.route("/income.csv")
 @login_required
 def income_csv():
-    ri = db.session.query(
-        FeeType.name.label("fee_name"),
-        func.sum(ReceiptItem.amount).label("amount"),
-    ).join(FeeType, FeeType.id == ReceiptItem.fee_type_id) \
-     .group_by(FeeType.name).order_by(FeeType.name.asc()).all()
-
-    def gen():
-        yield "Fee Type,Amount\n"
-        for r in ri:
-            amt = f"{float(r.amount or 0):.2f}"
-            yield f"{r.fee_name},{amt}\n"
-
-    return Response(gen(), mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment; filename=income_by_fee_type.csv"})
+    date_from, date_to, mode = _income_args()
+    ri = income_by_fee_type(_parse_day(date_from), _parse_day(date_to), [mode] if mode else None)
+    # one row per fee type, so nothing to stream from the database here
+    return csv_response("income_by_fee_type.csv", ("Fee Type", "Amount"),
+                        ((r.fee_name, money(r.amount)) for r in ri))
 
 @reports_bp.route("/discontinued/collectible")
 @login_required
 def discontinued_collectible():
-    has_discontinued = has_col(Student, "discontinued")
-    collectible_attr = "collectible" if has_col(Student, "collectible") else (
-        "collectible_after_discontinue" if has_col(Student, "collectible_after_discontinue") else None
-    )
-    if not (has_discontinued and collectible_attr):
-        return render_template("reports/discontinued.html", rows=[], title="Discontinued & Collectible", kind="collectible")
-
-    q = Student.query.filter(
-        (Student.discontinued == True) &
-        (getattr(Student, collectible_attr) == True)
-    ).order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc())
-    rows = _rows_with_balance(q)
+    cond = _discontinued_cond(True)
+    rows = student_balances(cond) if cond is not None else []
     return render_template("reports/discontinued.html",
                            rows=rows, title="Discontinued & Collectible", kind="collectible")
 
 @reports_bp.route("/discontinued/noncollectible")
 @login_required
 def discontinued_noncollectible():
-    has_discontinued = has_col(Student, "discontinued")
-    collectible_attr = "collectible" if has_col(Student, "collectible") else (
-        "collectible_after_discontinue" if has_col(Student, "collectible_after_discontinue") else None
-    )
-    if not (has_discontinued and collectible_attr):
-        return render_template("reports/discontinued.html", rows=[], title="Discontinued (Non-collectible)", kind="noncollectible")
-
-    q = Student.query.filter(
-        (Student.discontinued == True) &
-        (getattr(Student, collectible_attr) == False)
-    ).order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc())
-    rows = _rows_with_balance(q)
+    cond = _discontinued_cond(False)
+    rows = student_balances(cond) if cond is not None else []
     return render_template("reports/discontinued.html",
                            rows=rows, title="Discontinued (Non-collectible)", kind="noncollectible")
 
@@ -228,28 +195,6 @@ def discontinued_noncollectible():
 def discontinued_csv():
     """Export Discontinued lists to CSV. Use ?kind=collectible|noncollectible."""
     kind = (request.args.get("kind") or "collectible").lower()
-    has_discontinued = has_col(Student, "discontinued")
-    collectible_attr = "collectible" if has_col(Student, "collectible") else (
-        "collectible_after_discontinue" if has_col(Student, "collectible_after_discontinue") else None
-    )
-
-    rows = []
-    if has_discontinued and collectible_attr:
-        if kind == "noncollectible":
-            q = Student.query.filter(
-                (Student.discontinued == True) & (getattr(Student, collectible_attr) == False)
-            ).order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc())
-        else:
-            q = Student.query.filter(
-                (Student.discontinued == True) & (getattr(Student, collectible_attr) == True)
-            ).order_by(Student.class_name.asc(), Student.section.asc(), Student.name.asc())
-        rows = [(s, _student_balance(s.id)) for s in q]
-
-    def gen():
-        yield "Admission No,Name,Class,Section,Phone,Receivable\n"
-        for s, bal in rows:
-            yield f"{s.admission_no or ''},{s.name or ''},{s.class_name or ''},{s.section or ''},{s.phone or ''},{float(bal):.2f}\n"
-
-    filename = f"discontinued_{kind}.csv"
-    return Response(gen(), mimetype="text/csv",
-                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+    cond = _discontinued_cond(kind != "noncollectible")
+    query = balance_rows(cond, positive_only=False, order_by=ROSTER_ORDER) if cond is not None else None
+    return _balance_csv(f"discontinued_{kind}.csv", query)
@@ -0,0 +1,138 @@
+# preschool/rollups.py
+"""
+Per-day rollups of receipts for reconciliation and income reports.
+
+collection_daily holds one row per (day, mode) with the amount and number of
+receipts; income_daily one row per (day, fee type, mode) with the receipt
+item total. new_receipt() calls record_receipt() in the receipt's own
+transaction, so the rollups never disagree with the receipt tables;
+`flask rollups rebuild` recomputes them from scratch.
+
+Date filters on raw datetime columns go through day_range()/created_between()
+so they stay half-open ranges on the bare column (index friendly) instead of
+DATE(created_at) comparisons.
+"""
+import click
+from datetime import datetime, time, timedelta
+from flask.cli import AppGroup
+from sqlalchemy import func, select, insert, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .extensions import db
+from .models import Receipt, ReceiptItem, FeeType, CollectionDaily, IncomeDaily
+from .utils import D
+
+rollups_cli = AppGroup('rollups', help='Reporting rollup maintenance.')
+
+UPI_MODES = ('UPI', 'UPI-PhonePe', 'UPI-GPay', 'UPI-Paytm', 'UPI-Other')
+
+# ---------- date ranges ----------
+
+def day_range(start, end=None):
+    """[start 00:00, day after end 00:00) as datetimes; end defaults to start."""
+    end = end or start
+    return datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min)
+
+def created_between(col, start, end=None):
+    lo, hi = day_range(start, end)
+    return and_(col >= lo, col < hi)
+
+# ---------- maintenance ----------
+
+def record_receipt(rec, items=()):
+    """Add a new receipt and its items to the day's totals. Call before the receipt commits."""
+    day = (rec.created_at or datetime.utcnow()).date()
+    stmt = sqlite_insert(CollectionDaily).values(day=day, mode=rec.mode, amount=rec.amount or 0, count=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day', 'mode'],
+        set_={'amount': CollectionDaily.amount + stmt.excluded.amount,
+              'count': CollectionDaily.count + 1},
+    )
+    db.session.execute(stmt)
+
+    by_fee = {}
+    for item in items:
+        by_fee[item.fee_type_id] = by_fee.get(item.fee_type_id, D(0)) + D(item.amount or 0)
+    if by_fee:
+        stmt = sqlite_insert(IncomeDaily)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day', 'fee_type_id', 'mode'],
+            set_={'amount': IncomeDaily.amount + stmt.excluded.amount},
+        )
+        db.session.execute(stmt, [
+            {'day': day, 'fee_type_id': ft, 'mode': rec.mode, 'amount': amt} for ft, amt in by_fee.items()
+        ])
+
+def _rebuild(model, columns, select_from, start, end):
+    """Replace `model` rows for start..end (or all days) with a fresh aggregate."""
+    day = func.date(Receipt.created_at)
+    clear = model.__table__.delete()
+    source = Receipt.created_at.isnot(None)
+    if start:
+        clear = clear.where(model.day >= start, model.day <= (end or start))
+        source = created_between(Receipt.created_at, start, end)
+    db.session.execute(clear)
+    db.session.execute(insert(model).from_select(['day', *columns], select_from(day).where(source)))
+
+def rebuild_collections(start=None, end=None):
+    """Recompute collection_daily from receipts, for all days or start..end. Caller commits."""
+    _rebuild(CollectionDaily, ['mode', 'amount', 'count'],
+             lambda day: select(day, Receipt.mode, func.sum(Receipt.amount), func.count(Receipt.id))
+             .group_by(day, Receipt.mode),
+             start, end)
+
+def rebuild_income(start=None, end=None):
+    """Recompute income_daily from receipt items, for all days or start..end. Caller commits."""
+    _rebuild(IncomeDaily, ['fee_type_id', 'mode', 'amount'],
+             lambda day: select(day, ReceiptItem.fee_type_id, Receipt.mode, func.sum(ReceiptItem.amount))
+             .join(Receipt, Receipt.id == ReceiptItem.receipt_id)
+             .group_by(day, ReceiptItem.fee_type_id, Receipt.mode),
+             start, end)
+
+def rebuild_rollups(start=None, end=None):
+    rebuild_collections(start, end)
+    rebuild_income(start, end)
+
+def ensure_rollups():
+    """Backfill rollups once on databases that predate them."""
+    if db.session.query(Receipt.id).first() is None:
+        return
+    if db.session.query(CollectionDaily.id).first() is None:
+        rebuild_collections()
+    if db.session.query(IncomeDaily.id).first() is None and db.session.query(ReceiptItem.id).first() is not None:
+        rebuild_income()
+    db.session.commit()
+
+# ---------- reading ----------
+
+def collected(start, end=None, modes=None):
+    """Total received between two dates (inclusive), optionally for some modes."""
+    q = db.session.query(func.coalesce(func.sum(CollectionDaily.amount), 0)).filter(
+        CollectionDaily.day >= start, CollectionDaily.day <= (end or start))
+    if modes is not None:
+        q = q.filter(CollectionDaily.mode.in_(modes))
+    return D(q.scalar() or 0)
+
+def income_by_fee_type(start=None, end=None, modes=None):
+    """[(fee_name, amount)] for a date range (either end optional), by fee type name."""
+    q = (db.session.query(FeeType.name.label('fee_name'), func.sum(IncomeDaily.amount).label('amount'))
+         .join(FeeType, FeeType.id == IncomeDaily.fee_type_id))
+    if start:
+        q = q.filter(IncomeDaily.day >= start)
+    if end:
+        q = q.filter(IncomeDaily.day <= end)
+    if modes:
+        q = q.filter(IncomeDaily.mode.in_(modes))
+    return q.group_by(FeeType.name).order_by(FeeType.name.asc()).all()
+
+def income_modes():
+    return [m for (m,) in db.session.query(IncomeDaily.mode).distinct().order_by(IncomeDaily.mode) if m]
+
+@rollups_cli.command('rebuild')
+@click.option('--from', 'start', type=click.DateTime(['%Y-%m-%d']), help='First day (default: all).')
+@click.option('--to', 'end', type=click.DateTime(['%Y-%m-%d']), help='Last day (default: --from).')
+def rebuild_command(start, end):
+    """Recompute the daily collection and income totals from receipts."""
+    rebuild_rollups(start and start.date(), end and end.date())
+    db.session.commit()
+    click.echo(f'{db.session.query(CollectionDaily).count()} collection row(s), '
+               f'{db.session.query(IncomeDaily).count()} income row(s).')
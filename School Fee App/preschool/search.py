@@ -0,0 +1,150 @@
+# preschool/search.py
+"""
+Student search backed by an SQLite FTS5 index.
+
+student_fts is an external-content FTS5 table over student(name, parent_name,
+admission_no, phone). Triggers keep it in step with every INSERT/UPDATE/DELETE
+on student, including Core bulk inserts, so nothing in the views has to
+remember to reindex. If the SQLite build lacks FTS5, search falls back to the
+old LIKE scan.
+"""
+import re
+from sqlalchemy import text, or_
+from .extensions import db
+from .models import Student
+from .cache import TTLCache, watch
+
+FTS_COLUMNS = ("name", "parent_name", "admission_no", "phone")
+# bm25 column weights, same order as FTS_COLUMNS
+FTS_WEIGHTS = (10.0, 3.0, 8.0, 2.0)
+
+_fts_ready = None
+
+# Lookup pages (plain dicts) for the form typeaheads. Keystroke bursts repeat
+# the same prefixes, so a small cache absorbs most of them; any student or
+# balance change clears it.
+watch('students', Student)
+_lookups = TTLCache(120, 'students', 'balances', max_entries=500)
+
+# ---------- schema ----------
+
+def _trigger_sql():
+    cols = ", ".join(FTS_COLUMNS)
+    new = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    old = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS student_fts_ai AFTER INSERT ON student BEGIN
+              INSERT INTO student_fts(rowid, {cols}) VALUES (new.id, {new});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS student_fts_ad AFTER DELETE ON student BEGIN
+              INSERT INTO student_fts(student_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS student_fts_au AFTER UPDATE OF {cols} ON student BEGIN
+              INSERT INTO student_fts(student_fts, rowid, {cols}) VALUES ('delete', old.id, {old});
+              INSERT INTO student_fts(rowid, {cols}) VALUES (new.id, {new});
+            END""",
+    ]
+
+def ensure_student_fts(conn):
+    """Create the FTS table and its triggers if missing (idempotent).
+
+    Returns False when this SQLite has no FTS5 module.
+    """
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='student_fts'"
+    )).fetchone()
+    if not exists:
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE student_fts USING fts5({', '.join(FTS_COLUMNS)}, "
+                "content='student', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+        except Exception:
+            return False
+        conn.execute(text("INSERT INTO student_fts(student_fts) VALUES ('rebuild')"))
+    for sql in _trigger_sql():
+        conn.execute(text(sql))
+    return True
+
+def has_fts():
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = bool(db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='student_fts'"
+        )).fetchone())
+    return _fts_ready
+
+# ---------- querying ----------
+
+def fts_query(q):
+    """Turn free text into an FTS5 MATCH string: every word as a prefix, all required."""
+    words = re.findall(r"\w+", q or "")
+    return " ".join(f'"{w}"*' for w in words)
+
+def student_match(q):
+    """SQL criterion on Student for a search box value (None if q is blank)."""
+    q = (q or "").strip()
+    if not q:
+        return None
+    if has_fts():
+        match = fts_query(q)
+        if not match:
+            return None
+        ids = text("SELECT rowid FROM student_fts WHERE student_fts MATCH :m").bindparams(m=match)
+        return Student.id.in_(ids.columns(db.column("rowid")))
+    like = f"%{q}%"
+    return or_(Student.name.ilike(like), Student.admission_no.ilike(like),
+               Student.parent_name.ilike(like), Student.phone.ilike(like))
+
+def search_students(q, *criteria, limit=20, offset=0):
+    """Best matches first, as Student objects. Extra criteria filter on Student."""
+    q = (q or "").strip()
+    if not q:
+        return []
+    if has_fts():
+        match = fts_query(q)
+        if not match:
+            return []
+        weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+        ranked = text(
+            f"SELECT rowid AS id, bm25(student_fts, {weights}) AS score "
+            "FROM student_fts WHERE student_fts MATCH :m"
+        ).bindparams(m=match).columns(db.column("id"), db.column("score")).subquery()
+        query = (Student.query.join(ranked, ranked.c.id == Student.id)
+                 .filter(*criteria).order_by(ranked.c.score, Student.name))
+    else:
+        query = Student.query.filter(student_match(q), *criteria).order_by(Student.name)
+    return query.offset(offset).limit(limit).all()
+
+def lookup_row(s):
+    cls = f"{s.class_name or ''} {s.section or ''}".strip()
+    return {
+        'id': s.id,
+        'admission_no': s.admission_no or '',
+        'name': s.name,
+        'class': cls,
+        'credit': f"{s.credit_balance or 0:.2f}",
+        'balance': f"{s.balance_amount or 0:.2f}",
+        'label': f"{s.admission_no or ''} — {s.name} ({cls})",
+    }
+
+def lookup_students(q, page=1, per_page=10, active_only=True):
+    """One page of typeahead results: {'results': [...], 'more': bool}.
+
+    Blank queries list active students by name, so the picker can be browsed.
+    """
+    q = (q or "").strip().lower()
+    key = (q, page, per_page, active_only)
+
+    def load():
+        criteria = [Student.discontinued.is_(None)] if active_only else []
+        offset = (page - 1) * per_page
+        if q:
+            rows = search_students(q, *criteria, limit=per_page + 1, offset=offset)
+        else:
+            rows = (Student.query.filter(*criteria).order_by(Student.name, Student.id)
+                    .offset(offset).limit(per_page + 1).all())
+        return {'results': [lookup_row(s) for s in rows[:per_page]], 'more': len(rows) > per_page}
+
+    return _lookups.get(key, load)
@@ -1,31 +1,31 @@
 # preschool/settings.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required
 from datetime import date
 from .extensions import db
 from .models import AcademicYear, FeeType, PhonePeFeeRule
-from .utils import set_setting, get_setting, backup_sqlite, get_active_year_name
+from .utils import set_setting, get_setting, get_active_year_name, peek_receipt_no
+from .backups import start_backup, job_status, list_backups
 
 settings_bp = Blueprint('settings', __name__)
 
 @settings_bp.route('/')
 @login_required
 def index():
-    ay = AcademicYear.query.filter_by(is_active=True).first()
     fee_types = FeeType.query.order_by(FeeType.name.asc()).all()
     last_backup = get_setting("last_backup","Never")
     
-    active_year_name = ay.name if ay else 'Unset'
-    prefix = get_setting('receipt_prefix','AY').replace('AY', active_year_name.replace('-', ''))
-    seq = int(get_setting(f'receipt_seq_{active_year_name}', get_setting('receipt_seq', '1')))
-    fmt_preview = f"{prefix}-R-{seq:04d}"
+    active_year_name = get_active_year_name()
+    fmt_preview = peek_receipt_no()
 
     school = get_setting('school_name','My School')
     mode = get_setting('receipt_number_mode','auto')
     rules = PhonePeFeeRule.query.order_by(PhonePeFeeRule.name.asc()).all()
     
-    return render_template('settings/index.html', ay=ay, fee_types=fee_types,
-                           last_backup=last_backup, fmt_preview=fmt_preview,
+    backups = list_backups(current_app.config['BACKUP_FOLDER'])[:5]
+    return render_template('settings/index.html', active_year=active_year_name, fee_types=fee_types,
+                           last_backup=last_backup, backup_job=job_status(), backups=backups,
+                           fmt_preview=fmt_preview,
                            school=school, number_mode=mode, rules=rules)
 
 @settings_bp.route('/year/activate', methods=['POST'])
@@ -83,14 +83,18 @@ def set_school():
 @settings_bp.route('/backup')
 @login_required
 def backup_now():
-    path = backup_sqlite()
-    if "Error" in path:
-        flash(path, 'danger')
+    # runs on a background thread; the settings page shows its progress
+    if start_backup(current_app._get_current_object()):
+        flash('Backup started', 'success')
     else:
-        set_setting("last_backup", datetime.now().strftime('%Y-%m-%d %H:%M'))
-        flash(f'Backup created at {path}','success')
+        flash('A backup is already running', 'info')
     return redirect(url_for('settings.index'))
 
+@settings_bp.route('/backup/status')
+@login_required
+def backup_status():
+    return jsonify(job_status())
+
 # UPI Fee Rules
 @settings_bp.route('/upi_rules', methods=['POST'])
 @login_required
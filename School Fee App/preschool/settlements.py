@@ -0,0 +1,200 @@
+# preschool/settlements.py
+"""
+UPI settlement batches and the bank credits that pay them.
+
+match_credits() pairs unmapped bank credits with open batches without
+comparing every credit to every batch: credits are sorted by amount once,
+and for each batch a bisect finds the few whose amount is within
+`amount_tolerance` of the expected net. Among those, the credit dated inside
+[start_date, end_date + days] that is closest in amount, then closest to
+end_date, wins. Cost is O((n + m) log n) for n credits and m batches.
+
+A batch's bank_net is the sum of its mapped credits and its status is Open
+(nothing mapped), Matched (no variance) or Variance.
+
+generate_batches() cuts a date range into windows of N days and reads every
+window's UPI gross from collection_daily in one grouped query. Windows that
+already have a batch are recomputed in place (late receipts), new ones are
+inserted with executemany, and windows that overlap a batch with different
+bounds are left alone.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+import click
+from sqlalchemy import func, or_, update, insert, cast, Integer
+from flask.cli import AppGroup
+from .extensions import db
+from .models import BankCredit, SettlementBatch, CollectionDaily, PhonePeFeeRule
+from .rollups import UPI_MODES
+from .utils import D
+
+settlements_cli = AppGroup('settlements', help='UPI settlement batches.')
+
+MATCH_DAYS = 3             # credits may land up to this many days after a batch ends
+MATCH_AMOUNT = D('1.00')   # and differ from its expected net by at most this much
+
+def open_batches():
+    return SettlementBatch.query.filter(or_(SettlementBatch.status.is_(None), SettlementBatch.status == 'Open'))
+
+def unmapped_credits():
+    return BankCredit.query.filter(BankCredit.batch_id.is_(None))
+
+def _status(bank_net, expected, mapped):
+    if not mapped:
+        return 'Open'
+    return 'Matched' if bank_net == expected else 'Variance'
+
+def refresh_batches(batch_ids):
+    """Recompute bank_net / variance / status of these batches from their credits. Caller commits."""
+    batch_ids = list(set(batch_ids))
+    if not batch_ids:
+        return
+    sums = dict(db.session.query(BankCredit.batch_id, func.sum(BankCredit.amount_net))
+                .filter(BankCredit.batch_id.in_(batch_ids)).group_by(BankCredit.batch_id))
+    mappings = []
+    for bid, expected in (db.session.query(SettlementBatch.id, SettlementBatch.expected_net)
+                          .filter(SettlementBatch.id.in_(batch_ids))):
+        bank_net, expected = D(sums.get(bid) or 0), D(expected or 0)
+        mappings.append({'id': bid, 'bank_net': bank_net, 'variance': bank_net - expected,
+                         'status': _status(bank_net, expected, bid in sums)})
+    db.session.execute(update(SettlementBatch), mappings)
+
+def map_credits(batch, credits):
+    """Attach BankCredit rows to `batch` (moving them off any other batch). Caller commits."""
+    previous = [c.batch_id for c in credits if c.batch_id is not None]
+    db.session.execute(update(BankCredit), [{'id': c.id, 'batch_id': batch.id} for c in credits])
+    refresh_batches([batch.id, *previous])
+    return len(credits)
+
+def find_matches(credits, batches, days=MATCH_DAYS, amount_tolerance=MATCH_AMOUNT):
+    """[(batch_id, credit_id)] for (id, date, amount) credits and
+    (id, start_date, end_date, expected_net) batches; each credit used once."""
+    entries = sorted((D(amount or 0), day, cid) for cid, day, amount in credits)
+    amounts = [e[0] for e in entries]
+    used = set()
+    pairs = []
+    for bid, start, end, expected in sorted(batches, key=lambda b: (b[2], b[0])):
+        expected = D(expected or 0)
+        lo = bisect_left(amounts, expected - amount_tolerance)
+        hi = bisect_right(amounts, expected + amount_tolerance)
+        latest = end + timedelta(days=days)
+        best = None
+        for amount, day, cid in entries[lo:hi]:
+            if cid in used or not (start <= day <= latest):
+                continue
+            key = (abs(amount - expected), abs((day - end).days), cid)
+            if best is None or key < best:
+                best = key
+        if best is not None:
+            used.add(best[-1])
+            pairs.append((bid, best[-1]))
+    return pairs
+
+def match_credits(days=MATCH_DAYS, amount_tolerance=MATCH_AMOUNT):
+    """Map unmapped credits to open batches automatically. Caller commits.
+
+    Returns the number of batches matched.
+    """
+    credits = unmapped_credits().with_entities(BankCredit.id, BankCredit.date, BankCredit.amount_net).all()
+    batches = open_batches().with_entities(SettlementBatch.id, SettlementBatch.start_date,
+                                           SettlementBatch.end_date, SettlementBatch.expected_net).all()
+    pairs = find_matches(credits, batches, days, amount_tolerance)
+    if pairs:
+        db.session.execute(update(BankCredit), [{'id': cid, 'batch_id': bid} for bid, cid in pairs])
+        refresh_batches([bid for bid, _ in pairs])
+    return len(pairs)
+
+# ---------- batch generation ----------
+
+def settlement_charges(gross, rule=None, percent=None, flat=None):
+    """Provider charges on `gross`: the overrides if given, else the rule's percent + flat."""
+    charges = D(0)
+    if percent:
+        charges += gross * D(percent) / D(100)
+    if flat:
+        charges += D(flat)
+    if charges == 0 and rule is not None:
+        if rule.percent:
+            charges += gross * D(rule.percent) / D(100)
+        if rule.flat:
+            charges += D(rule.flat)
+    return charges.quantize(D('0.01'))
+
+def default_rule():
+    return PhonePeFeeRule.query.filter(PhonePeFeeRule.active != False).order_by(PhonePeFeeRule.id).first()
+
+def windows(start, end, days):
+    """[(window_start, window_end)] covering start..end in steps of `days`; the last may be short."""
+    out = []
+    day = start
+    while day <= end:
+        out.append((day, min(day + timedelta(days=days - 1), end)))
+        day += timedelta(days=days)
+    return out
+
+def window_gross(start, end, days):
+    """{window index: UPI gross} for start..end, one grouped query over collection_daily."""
+    idx = cast((func.julianday(CollectionDaily.day) - func.julianday(start.isoformat())) / days, Integer)
+    rows = (db.session.query(idx, func.sum(CollectionDaily.amount))
+            .filter(CollectionDaily.day >= start, CollectionDaily.day <= end,
+                    CollectionDaily.mode.in_(UPI_MODES))
+            .group_by(idx))
+    return {i: D(total or 0) for i, total in rows}
+
+def generate_batches(start, end, days, rule=None, percent=None, flat=None):
+    """Create or recompute UPI batches for every `days`-long window in start..end. Caller commits.
+
+    Returns {'created': n, 'updated': n, 'skipped': [(start, end), ...]}.
+    """
+    spans = windows(start, end, days)
+    gross = window_gross(start, end, days)
+
+    existing = {}
+    covered = set()
+    for b in (SettlementBatch.query
+              .filter(SettlementBatch.start_date <= end, SettlementBatch.end_date >= start,
+                      or_(SettlementBatch.provider.is_(None), SettlementBatch.provider == 'UPI'))):
+        existing[(b.start_date, b.end_date)] = b
+        day = max(b.start_date, start)
+        while day <= min(b.end_date, end):
+            covered.add(day)
+            day += timedelta(days=1)
+    mapped = {bid for (bid,) in db.session.query(BankCredit.batch_id).distinct()
+              .filter(BankCredit.batch_id.in_([b.id for b in existing.values()]))}
+
+    new, changed, skipped = [], [], []
+    for i, (lo, hi) in enumerate(spans):
+        total = gross.get(i, D(0))
+        charges = settlement_charges(total, rule, percent, flat)
+        expected = total - charges
+        batch = existing.get((lo, hi))
+        if batch is not None:
+            bank_net = D(batch.bank_net or 0)
+            changed.append({'id': batch.id, 'gross': total, 'charges': charges, 'expected_net': expected,
+                            'variance': bank_net - expected, 'rule_id': getattr(rule, 'id', None),
+                            'status': _status(bank_net, expected, batch.id in mapped)})
+        elif any(lo + timedelta(days=k) in covered for k in range((hi - lo).days + 1)):
+            skipped.append((lo, hi))
+        elif total:
+            new.append({'provider': 'UPI', 'start_date': lo, 'end_date': hi, 'days_grouping': days,
+                        'rule_id': getattr(rule, 'id', None), 'gross': total, 'charges': charges,
+                        'expected_net': expected, 'bank_net': D(0), 'variance': -expected, 'status': 'Open'})
+    if new:
+        db.session.execute(insert(SettlementBatch), new)
+    if changed:
+        db.session.execute(update(SettlementBatch), changed)
+    return {'created': len(new), 'updated': len(changed), 'skipped': skipped}
+
+@settlements_cli.command('generate')
+@click.option('--from', 'start', type=click.DateTime(['%Y-%m-%d']), required=True, help='First day.')
+@click.option('--to', 'end', type=click.DateTime(['%Y-%m-%d']), required=True, help='Last day.')
+@click.option('--days', default=1, show_default=True, help='Days per settlement window.')
+@click.option('--rule', 'rule_id', type=int, help='Fee rule id (default: first active rule).')
+def generate_command(start, end, days, rule_id):
+    """Create or recompute UPI settlement batches for a date range."""
+    rule = db.session.get(PhonePeFeeRule, rule_id) if rule_id else default_rule()
+    result = generate_batches(start.date(), end.date(), days, rule)
+    match_credits()
+    db.session.commit()
+    click.echo(f"{result['created']} created, {result['updated']} recomputed, "
+               f"{len(result['skipped'])} skipped (overlap a batch with other dates).")
@@ -1,13 +1,18 @@
 # preschool/students.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, date
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import selectinload
 from .extensions import db
 from .models import Student
 from .security import role_required, audit
-# MODIFIED: Removed 'balance_for_student' from this line as it's no longer in utils
-from .utils import D, receivable_for_student, received_for_student
-import csv, io
+from .utils import D
+from .balances import balance_for
+from .search import student_match, lookup_students
+from .instrument import query_budget
+from .imports import read_csv, import_students as bulk_import_students, import_opening as bulk_import_opening
+import json
 
 students_bp = Blueprint('students', __name__)
 
@@ -24,6 +29,69 @@ def parse_iso_date(val):
         except Exception:
             return None
 
+# ---------- server-side list ----------
+# Sortable DataTables columns: key -> (column, stand-in for NULL so keyset
+# comparisons stay total).
+SORTABLE = {
+    'admission_no': (Student.admission_no, ''),
+    'name': (Student.name, ''),
+    'class': (Student.class_name, ''),
+    'parent_name': (Student.parent_name, ''),
+    'phone': (Student.phone, ''),
+    'balance': (Student.balance_amount, 0),
+    'credit': (Student.credit_balance, 0),
+    'created_at': (Student.created_at, datetime(1970, 1, 1)),
+}
+PAGE_MAX = 500
+
+def _filtered(query, q=None, cls=None, sec=None):
+    match = student_match(q)
+    if match is not None:
+        query = query.filter(match)
+    if cls:
+        query = query.filter(Student.class_name == cls)
+    if sec:
+        query = query.filter(Student.section == sec)
+    return query
+
+def _cursor_out(value, null_value, sid):
+    if value is None:
+        value = null_value
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif value is not None and not isinstance(value, str):
+        value = str(value)
+    return json.dumps([value, sid])
+
+def _cursor_in(raw, null_value):
+    """Decode an `after` cursor into (sort value, id); None if malformed."""
+    try:
+        value, sid = json.loads(raw)
+        if isinstance(null_value, datetime):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(null_value, str):
+            value = D(value)
+        return value, int(sid)
+    except Exception:
+        return None
+
+def _student_row(s):
+    return {
+        'id': s.id,
+        'admission_no': s.admission_no or '',
+        'name': s.name,
+        'class': f"{s.class_name or ''} {s.section or ''}".strip(),
+        'parent_name': s.parent_name or '',
+        'phone': s.phone or '',
+        'balance': f"{D(s.balance_amount or 0):.2f}",
+        'credit': f"{D(s.credit_balance or 0):.2f}",
+        'status': 'Discontinued' if s.discontinued else 'Active',
+        'links': [
+            {'label': 'Edit', 'url': url_for('students.edit_student', id=s.id)},
+            {'label': 'Fee Plan', 'url': url_for('fees.plans', student_id=s.id)},
+        ],
+    }
+
 # ---------- routes ----------
 @students_bp.route('/')
 @login_required
@@ -31,22 +99,85 @@ def list_students():
     q = request.args.get('q', '').strip()
     cls = request.args.get('class')
     sec = request.args.get('section')
+    classes = [c for (c,) in db.session.query(Student.class_name).distinct().order_by(Student.class_name) if c]
+    sections = [c for (c,) in db.session.query(Student.section).distinct().order_by(Student.section) if c]
+    # rows are fetched page by page from list_data
+    data_url = url_for('students.list_data', q=q or None, section=sec or None, **{'class': cls or None})
+    return render_template('students/list.html', q=q, cls=cls, sec=sec, classes=classes, sections=sections,
+                           data_url=data_url)
 
-    query = Student.query
-    if q:
-        like = f"%{q}%"
-        query = query.filter(
-            (Student.name.ilike(like)) |
-            (Student.admission_no.ilike(like)) |
-            (Student.parent_name.ilike(like))
-        )
-    if cls:
-        query = query.filter(Student.class_name == cls)
-    if sec:
-        query = query.filter(Student.section == sec)
+@students_bp.route('/data')
+@login_required
+def list_data():
+    """One page of students for the DataTables server-side protocol.
+
+    Understands draw/start/length/search[value]/order[0][...] plus q, class
+    and section. Passing `after` (the `next` cursor of the previous page)
+    switches from OFFSET to keyset paging, so deep pages cost the same as
+    the first.
+    """
+    args = request.args
+    try:
+        draw = int(args.get('draw', 0))
+        start = max(int(args.get('start', 0)), 0)
+        length = int(args.get('length', 25))
+    except ValueError:
+        return jsonify(error='bad paging parameters'), 400
+    if length <= 0 or length > PAGE_MAX:
+        length = PAGE_MAX
 
-    rows = query.order_by(Student.created_at.desc()).all()
-    return render_template('students/list.html', rows=rows, q=q, cls=cls, sec=sec)
+    col = args.get('order[0][column]')
+    key = args.get(f'columns[{col}][data]') if col is not None else None
+    if key not in SORTABLE:
+        key, desc = 'created_at', True
+    else:
+        desc = args.get('order[0][dir]') == 'desc'
+    column, null_value = SORTABLE[key]
+    sort = func.coalesce(column, null_value)
+
+    query = _filtered(Student.query, args.get('q', '').strip(), args.get('class'), args.get('section'))
+    query = _filtered(query, args.get('search[value]', '').strip())
+
+    total = db.session.query(func.count(Student.id)).scalar()
+    filtered = query.order_by(None).count()
+
+    order = (sort.desc(), Student.id.desc()) if desc else (sort.asc(), Student.id.asc())
+    query = query.order_by(*order)
+    cursor = _cursor_in(args['after'], null_value) if args.get('after') else None
+    if cursor:
+        value, sid = cursor
+        if desc:
+            query = query.filter(or_(sort < value, and_(sort == value, Student.id < sid)))
+        else:
+            query = query.filter(or_(sort > value, and_(sort == value, Student.id > sid)))
+    else:
+        query = query.offset(start)
+    rows = query.limit(length).all()
+
+    last = rows[-1] if len(rows) == length else None
+    return jsonify(
+        draw=draw,
+        recordsTotal=total,
+        recordsFiltered=filtered,
+        data=[_student_row(s) for s in rows],
+        next=_cursor_out(getattr(last, column.key), null_value, last.id) if last else None,
+    )
+
+@students_bp.route('/search')
+@login_required
+def search():
+    """Typeahead: ranked prefix matches on name, parent, admission no. and phone.
+
+    ?q=&page=&limit=&all=1 -> {"results": [...], "more": bool}. Only active
+    students are returned unless all=1.
+    """
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        page, limit = 1, 10
+    return jsonify(lookup_students(request.args.get('q', ''), page=page, per_page=limit,
+                                   active_only=request.args.get('all') != '1'))
 
 @students_bp.route('/new', methods=['GET', 'POST'])
 @role_required(['Owner', 'Manager'])
@@ -111,31 +242,21 @@ def import_students():
         flash('Upload a CSV file', 'warning')
         return redirect(url_for('students.list_students'))
     try:
-        stream = io.StringIO(f.stream.read().decode('utf-8'))
-        reader = csv.DictReader(stream)
-        count = 0
-        for row in reader:
-            if not row.get('admission_no') or not row.get('name'):
-                continue
-            if Student.query.filter_by(admission_no=row['admission_no']).first():
-                continue
-            s = Student(
-                admission_no=row['admission_no'],
-                name=row['name'],
-                class_name=row.get('class_name'),
-                section=row.get('section'),
-                parent_name=row.get('parent_name'),
-                phone=row.get('phone'),
-                email=row.get('email'),
-            )
-            db.session.add(s)
-            count += 1
+        result = bulk_import_students(read_csv(f))
         db.session.commit()
-        audit(actor=current_user.username, action='IMPORT', table='student', record_id='-', before={}, after={'count': count})
-        flash(f'Imported {count} students', 'success')
     except Exception as e:
+        db.session.rollback()
         flash(f'Import failed: {e}', 'danger')
-    return redirect(url_for('students.list_students'))
+        return redirect(url_for('students.list_students'))
+    count, errors = result['inserted'], result['errors']
+    audit(actor=current_user.username, action='IMPORT', table='student', record_id='-', before={},
+          after={'count': count, 'rejected': len(errors)})
+    if not errors:
+        flash(f'Imported {count} students', 'success')
+        return redirect(url_for('students.list_students'))
+    flash(f'Imported {count} students; {len(errors)} row(s) rejected', 'warning')
+    return render_template('students/import_report.html', title='Student Import',
+                           summary=f'{count} student(s) imported.', errors=errors)
 
 @students_bp.route('/import_opening', methods=['POST'])
 @role_required(['Owner', 'Manager'])
@@ -144,24 +265,20 @@ def import_opening():
     if not f:
         flash('Upload a CSV file', 'warning')
         return redirect(url_for('students.list_students'))
-    stream = io.StringIO(f.stream.read().decode('utf-8'))
-    reader = csv.DictReader(stream)
-    count = 0
-    for row in reader:
-        adm = row.get('admission_no')
-        if not adm:
-            continue
-        s = Student.query.filter_by(admission_no=adm).first()
-        if not s:
-            continue
-        if row.get('opening_balance'):
-            s.balance_amount = D(row.get('opening_balance'))
-        if row.get('credit_balance'):
-            s.credit_balance = D(row.get('credit_balance'))
-        count += 1
-    db.session.commit()
-    flash(f'Updated opening balances for {count} students', 'success')
-    return redirect(url_for('students.list_students'))
+    try:
+        result = bulk_import_opening(read_csv(f))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Import failed: {e}', 'danger')
+        return redirect(url_for('students.list_students'))
+    count, errors = result['updated'], result['errors']
+    if not errors:
+        flash(f'Updated opening balances for {count} students', 'success')
+        return redirect(url_for('students.list_students'))
+    flash(f'Updated opening balances for {count} students; {len(errors)} row(s) rejected', 'warning')
+    return render_template('students/import_report.html', title='Opening Balance Import',
+                           summary=f'{count} student(s) updated.', errors=errors)
 
 @students_bp.route('/template/students.csv')
 def template_students():
@@ -184,16 +301,14 @@ def template_opening():
 
 @students_bp.route('/<int:id>/card')
 @login_required
+@query_budget(6)
 def student_card(id):
-    s = Student.query.get_or_404(id)
-    receivable = receivable_for_student(id)
-    received = received_for_student(id)
-    balance = receivable - received
-    # history is accessible via relationship: s.receipts
+    s = Student.query.options(selectinload(Student.receipts)).filter_by(id=id).first_or_404()
+    ledger = balance_for(id)
     return render_template(
         'students/card.html',
         s=s,
-        receivable=receivable,
-        received=received,
-        balance=balance
+        receivable=ledger['receivable'],
+        received=ledger['received'],
+        balance=ledger['balance']
     )
\ No newline at end of file
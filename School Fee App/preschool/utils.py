@@ -1,21 +1,36 @@
 # preschool/utils.py
-from flask import current_app
 from datetime import datetime, date
 from decimal import Decimal
 from .extensions import db
-from .models import SystemSetting, Student, Receipt, StudentFee, AcademicYear
+from .models import SystemSetting, AcademicYear, ReceiptSequence
+from .cache import TTLCache, watch
 import os
-import shutil
-import zipfile
 
 D = Decimal
 
 def now():
     return datetime.now()
 
+# -------------- settings cache -----------------
+# All SystemSetting rows plus the active AcademicYear are loaded in one go and
+# shared across requests. Commits touching either table clear the cache; the
+# TTL only matters for edits made by another process (e.g. a flask CLI run).
+
+watch('settings', SystemSetting, AcademicYear)
+_settings_cache = TTLCache(60, 'settings')
+
+def _load_settings():
+    ay = AcademicYear.query.filter_by(is_active=True).first()
+    return {
+        'values': {s.key: s.value for s in SystemSetting.query.all()},
+        'active_year': ay.name if ay else None,
+    }
+
+def _settings():
+    return _settings_cache.get('all', _load_settings)
+
 def school_name():
-    s = SystemSetting.query.filter_by(key="school_name").first()
-    return s.value if s else "Your School"
+    return _settings()["values"].get("school_name", "Your School")
 
 def set_setting(key, value):
     s = SystemSetting.query.filter_by(key=key).first()
@@ -27,75 +42,71 @@ def set_setting(key, value):
     db.session.commit()
 
 def get_setting(key, default=None):
-    s = SystemSetting.query.filter_by(key=key).first()
-    return s.value if s else default
+    return _settings()['values'].get(key, default)
 
 def get_active_year_name():
-    ay = AcademicYear.query.filter_by(is_active=True).first()
-    return ay.name if ay else "Unset"
+    return _settings()['active_year'] or "Unset"
+
+# -------------- receipt numbering -----------------
+
+def _receipt_prefix(active_year):
+    year_str = active_year.replace('-', '') if active_year != "Unset" else str(datetime.now().year)
+    return get_setting("receipt_prefix", "AY").replace("AY", year_str)
+
+def _receipt_seq_start(active_year):
+    """Where a year's counter starts: the legacy per-year / global settings."""
+    return int(get_setting(f"receipt_seq_{active_year}", get_setting("receipt_seq", "1")))
+
+def _seed_receipt_sequence(name, active_year):
+    """Create the year's counter row if missing."""
+    from sqlalchemy.dialects.sqlite import insert
+    db.session.execute(
+        insert(ReceiptSequence).values(name=name, next_value=_receipt_seq_start(active_year))
+        .on_conflict_do_nothing(index_elements=['name'])
+    )
+
+def peek_receipt_no():
+    """The number the next auto-numbered receipt would get. Read-only.
+
+    Safe for templates and GET handlers: it reserves nothing, so the value
+    may already be taken by the time a receipt is saved.
+    """
+    active_year = get_active_year_name()
+    n = db.session.query(ReceiptSequence.next_value).filter(
+        ReceiptSequence.name == f"receipt_{active_year}"
+    ).scalar()
+    if n is None:
+        n = _receipt_seq_start(active_year)
+    return f"{_receipt_prefix(active_year)}-R-{n:04d}"
 
 def next_receipt_no():
+    """Allocate the next receipt number inside the caller's transaction.
+
+    The counter is bumped with a single UPDATE ... RETURNING, which takes
+    SQLite's write lock, so concurrent cashiers queue instead of reading the
+    same value. Nothing is committed here: if the receipt insert fails and the
+    caller rolls back, the number is handed out again. Call it right before
+    adding the Receipt, as the first write of the transaction.
+    """
     mode = get_setting("receipt_number_mode", "auto")
     if mode == 'manual':
         return None
 
-    prefix = get_setting("receipt_prefix", "AY")
     active_year = get_active_year_name()
-    year_str = active_year.replace('-', '') if active_year != "Unset" else str(datetime.now().year)
-    prefix = prefix.replace("AY", year_str)
-    
-    seq_key = f"receipt_seq_{active_year}"
-    setting = SystemSetting.query.filter_by(key=seq_key).first()
-    
-    if not setting:
-        global_seq = get_setting("receipt_seq", "1")
-        n = int(global_seq)
-        setting = SystemSetting(key=seq_key, value=str(n + 1))
-        db.session.add(setting)
-    else:
-        n = int(setting.value)
-        setting.value = str(n + 1)
-
-    db.session.commit()
-    return f"{prefix}-R-{n:04d}"
+    name = f"receipt_{active_year}"
+    bump = (
+        db.update(ReceiptSequence)
+        .where(ReceiptSequence.name == name)
+        .values(next_value=ReceiptSequence.next_value + 1)
+        .returning(ReceiptSequence.next_value)
+    )
+    n = db.session.execute(bump, execution_options={'synchronize_session': False}).scalar()
+    if n is None:
+        _seed_receipt_sequence(name, active_year)
+        n = db.session.execute(bump, execution_options={'synchronize_session': False}).scalar()
+    return f"{_receipt_prefix(active_year)}-R-{n - 1:04d}"
 
 def ensure_default_dirs(app):
     for p in (app.config.get("UPLOAD_FOLDER"), app.config.get("BACKUP_FOLDER"), app.instance_path):
         if p and not os.path.exists(p):
             os.makedirs(p, exist_ok=True)
-
-# ADDED: The missing backup_sqlite function
-def backup_sqlite():
-    """Creates a timestamped zip backup of the SQLite database."""
-    db_path_str = current_app.config["SQLALCHEMY_DATABASE_URI"].replace("sqlite:///", "")
-    db_path = os.path.normpath(db_path_str)
-    
-    if not os.path.exists(db_path):
-        return "Error: Database file not found."
-
-    backup_folder = current_app.config["BACKUP_FOLDER"]
-    ensure_default_dirs(current_app)
-
-    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-    zip_filename = f"backup-{stamp}.zip"
-    zip_path = os.path.join(backup_folder, zip_filename)
-
-    try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            zf.write(db_path, os.path.basename(db_path))
-        return zip_path
-    except Exception as e:
-        return f"Error creating backup: {e}"
-
-# -------------- business helpers -----------------
-
-def receivable_for_student(student_id):
-    rows = StudentFee.query.filter_by(student_id=student_id).all()
-    return sum((r.amount or 0) for r in rows) or D(0)
-
-def received_for_student(student_id):
-    from sqlalchemy import func
-    amt = db.session.query(func.coalesce(func.sum(Receipt.amount), 0)).filter(
-        Receipt.student_id == student_id
-    ).scalar() or 0
-    return D(amt)
\ No newline at end of file
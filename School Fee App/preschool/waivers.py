@@ -2,17 +2,16 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from .extensions import db
-from .models import Waiver, Student, FeeType
+from .models import Waiver, FeeType, StudentFee
 from .security import role_required, audit
 from .utils import D
+from .ledger import apply_waiver
 
 waivers_bp = Blueprint('waivers', __name__)
 
 @waivers_bp.route('/', methods=['GET','POST'])
 @role_required(['Owner','Manager'])
 def list_create():
-    students = Student.query.order_by(Student.name.asc()).all()
-    types = FeeType.query.order_by(FeeType.name.asc()).all()
     if request.method == 'POST':
         try:
             # ADDED: Input validation
@@ -31,7 +30,8 @@ def list_create():
         flash('Waiver created; pending approval','success')
         return redirect(url_for('waivers.list_create'))
     rows = Waiver.query.order_by(Waiver.created_at.desc()).limit(100).all()
-    return render_template('waivers/list.html', rows=rows, students=students, types=types)
+    types = FeeType.query.order_by(FeeType.name.asc()).all()
+    return render_template('waivers/list.html', rows=rows, types=types)
 
 @waivers_bp.route('/<int:id>/approve', methods=['POST'])
 @role_required(['Owner','Manager'])
@@ -42,12 +42,15 @@ def approve(id):
         return redirect(url_for('waivers.list_create'))
     before = {'approved': w.approved}
     w.approved = True; w.approved_by = current_user.username
-    s = Student.query.get(w.student_id)
     reduction = D(w.amount or 0)
     if reduction == D(0) and w.percent:
-        total = sum([D(p.amount_total or 0) for p in s.fee_plans if p.fee_type_id == w.fee_type_id], D(0))
-        reduction = (total * D(w.percent) / D(100))
-    s.balance_amount = (s.balance_amount or D(0)) - reduction
+        total = db.session.query(db.func.coalesce(db.func.sum(StudentFee.amount), 0)).filter(
+            StudentFee.student_id == w.student_id,
+            StudentFee.fee_type_id == w.fee_type_id
+        ).scalar() or 0
+        reduction = (D(total) * D(w.percent) / D(100)).quantize(D('0.01'))
+        w.amount = reduction  # the balance engine sums approved waiver amounts
+    apply_waiver(w)
     db.session.commit()
     audit(current_user.username,'APPROVE','waiver',w.id,before, {'approved':True}, reason=w.reason)
     flash(f'Waiver approved. Reduced balance by ₹{reduction}','success')
@@ -0,0 +1,39 @@
+# scripts/bench/bench_aging.py
+"""
+Receivables aging: time and statements of the aging engine (aging_frame()
+plus aging_totals()) and of the /reports/aging page. The target is a
+10,000-student school aged in under a second.
+
+    python scripts/bench/bench_aging.py --students 10000
+"""
+from datetime import date
+from common import parser, make_app, seed, login, QueryCounter, timed
+
+AS_OF = date(2025, 9, 1)
+REPEAT = 5
+
+def run_aging():
+    from preschool.aging import aging_frame, aging_totals
+    frame = aging_frame(as_of=AS_OF)
+    return frame, aging_totals(frame)
+
+def main():
+    args = parser(__doc__, students=10000).parse_args()
+    app = seed(make_app(args.db), args.students, receipts_per_student=2)
+    counter = QueryCounter(app)
+    client = login(app)
+
+    with app.app_context():
+        run_aging()   # warm the page cache and pandas imports
+        counter.count = 0
+        (frame, totals), ms = timed(run_aging, REPEAT)
+        print(f'{args.students} students  aging engine    {counter.count // REPEAT:4d} queries {ms:8.1f} ms  '
+              f'({len(frame)} open, {totals["overdue"]:.2f} overdue)')
+    client.get('/reports/aging')
+    counter.count = 0
+    response, ms = timed(lambda: client.get('/reports/aging'), REPEAT)
+    assert response.status_code == 200, response.status_code
+    print(f'{args.students} students  /reports/aging  {counter.count // REPEAT:4d} queries {ms:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
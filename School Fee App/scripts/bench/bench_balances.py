@@ -0,0 +1,43 @@
+# scripts/bench/bench_balances.py
+"""
+Balance reports: statements and time per request, against the old
+per-student loop (two SUM queries per student).
+
+    python scripts/bench/bench_balances.py --students 2000
+"""
+from common import parser, make_app, seed, login, QueryCounter, timed
+
+PAGES = ['/reports/summary', '/reports/overdue', '/reports/overdue.csv']
+
+def per_student_loop():
+    """The pre-balance-engine summary: receivable and received queried per student."""
+    from sqlalchemy import func
+    from preschool.extensions import db
+    from preschool.models import Student, StudentFee, Receipt
+    rows = []
+    for s in Student.query.order_by(Student.name.asc()).all():
+        rcv = db.session.query(func.coalesce(func.sum(StudentFee.amount), 0)).filter_by(student_id=s.id).scalar()
+        rec = db.session.query(func.coalesce(func.sum(Receipt.amount), 0)).filter_by(student_id=s.id).scalar()
+        if rcv - rec > 0 and (s.discontinued is None or s.collectible):
+            rows.append((s, rcv - rec))
+    return sorted(rows, key=lambda r: r[1], reverse=True)
+
+def main():
+    args = parser(__doc__).parse_args()
+    app = seed(make_app(args.db), args.students)
+    counter = QueryCounter(app)
+    client = login(app)
+
+    with app.app_context():
+        counter.count = 0
+        rows, ms = timed(per_student_loop)
+        print(f'{args.students} students  per-student loop   {counter.count:6d} queries {ms:8.1f} ms  ({len(rows)} owing)')
+    for page in PAGES:
+        client.get(page)   # warm templates and caches
+        counter.count = 0
+        response, ms = timed(lambda: client.get(page))
+        assert response.status_code == 200, response.status_code
+        print(f'{args.students} students  {page:19} {counter.count:6d} queries {ms:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
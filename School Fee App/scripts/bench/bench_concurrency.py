@@ -0,0 +1,94 @@
+# scripts/bench/bench_concurrency.py
+"""
+Readers and receipt writers in separate processes on one SQLite file:
+throughput, p95 latency and errors with the shipped engine settings (WAL,
+busy_timeout, ...) against plain pysqlite defaults (rollback journal, no
+busy timeout) -- the 'before' mode clears SQLITE_PRAGMAS and
+SQLALCHEMY_ENGINE_OPTIONS.
+
+    python scripts/bench/bench_concurrency.py --mode before --readers 4 --writers 2
+    python scripts/bench/bench_concurrency.py --mode after --readers 4 --writers 2
+"""
+import logging
+import multiprocessing
+import random
+import time
+from common import parser, make_app, seed, login
+
+READ_URLS = ['/reports/summary', '/reports/overdue', '/receipts/', '/']
+
+def _config(mode):
+    return {'SQLITE_PRAGMAS': {}, 'SQLALCHEMY_ENGINE_OPTIONS': {}} if mode == 'before' else {}
+
+def worker(kind, seed_value, args, fee_type_id, path, start, results):
+    app = make_app(path, fresh=False, **_config(args.mode))
+    app.logger.setLevel(logging.CRITICAL)
+    client = login(app)
+    rnd = random.Random(seed_value)
+    while time.time() < start:
+        time.sleep(0.01)
+    ok_ms, errors, kinds = [], 0, set()
+    while time.time() < start + args.duration:
+        t = time.perf_counter()
+        try:
+            if kind == 'read':
+                ok = client.get(rnd.choice(READ_URLS)).status_code == 200
+            else:
+                response = client.post('/receipts/new', data={
+                    'student_id': rnd.randint(1, args.students), 'mode': 'Cash', f'amt_{fee_type_id}': '100'})
+                ok = response.status_code == 302 and '/new' not in response.headers.get('Location', '')
+        except Exception as e:
+            ok = False
+            kinds.add(f'{type(e).__name__}: {str(e)[:60]}')
+        if ok:
+            ok_ms.append((time.perf_counter() - t) * 1000)
+        else:
+            errors += 1
+    results.put((kind, ok_ms, errors, sorted(kinds)))
+
+def _p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))] if values else 0
+
+def main():
+    p = parser(__doc__, students=5000)
+    p.add_argument('--mode', choices=['before', 'after'], default='after')
+    p.add_argument('--readers', type=int, default=4)
+    p.add_argument('--writers', type=int, default=2)
+    p.add_argument('--duration', type=float, default=15, help='seconds of load')
+    args = p.parse_args()
+
+    app = seed(make_app(args.db, **_config(args.mode)), args.students)
+    from preschool.extensions import db
+    from preschool.models import FeeType
+    with app.app_context():
+        journal = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+        fee_type_id = FeeType.query.filter_by(name='Fee0').one().id
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')   # each worker builds its own app and engine
+    results, start = ctx.Queue(), time.time() + 8
+    procs = [ctx.Process(target=worker, args=('read', i, args, fee_type_id, app.bench_db, start, results))
+             for i in range(args.readers)]
+    procs += [ctx.Process(target=worker, args=('write', 100 + i, args, fee_type_id, app.bench_db, start, results))
+              for i in range(args.writers)]
+    for proc in procs:
+        proc.start()
+    done = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    reads = [ms for kind, times, _, _ in done if kind == 'read' for ms in times]
+    writes = [ms for kind, times, _, _ in done if kind == 'write' for ms in times]
+    read_errors = sum(e for kind, _, e, _ in done if kind == 'read')
+    write_errors = sum(e for kind, _, e, _ in done if kind == 'write')
+    kinds = sorted({k for *_, ks in done for k in ks})
+    print(f'{args.mode:6} journal={journal:8} R={args.readers} W={args.writers}  '
+          f'reads {len(reads) / args.duration:6.1f}/s p95 {_p95(reads):5.0f} ms err {read_errors:3}  |  '
+          f'receipts {len(writes) / args.duration:6.1f}/s p95 {_p95(writes):5.0f} ms '
+          f'max {max(writes or [0]):5.0f} ms err {write_errors:3}')
+    for kind in kinds:
+        print('  ', kind)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# scripts/bench/bench_exports.py
+"""
+overdue.csv streaming: time to first byte, total time and peak RSS growth,
+against building the whole export in memory first (every Student object
+loaded into a list, rows written with f-strings), as the old export did.
+
+The database is seeded in a child process so the seeding does not raise
+this process's peak RSS before the measurement. Linux/macOS only
+(resource module).
+
+    python scripts/bench/bench_exports.py --students 100000
+"""
+import multiprocessing
+import resource
+import time
+from common import parser, make_app, seed, login
+
+def _seed(path, n):
+    seed(make_app(path), n)
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def streamed(client):
+    response = client.get('/reports/overdue.csv', buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    ttfb = time.perf_counter()
+    size = len(first) + sum(len(c) for c in chunks)
+    return size, ttfb
+
+def in_memory():
+    """The old approach: materialise every row, then format."""
+    from preschool.balances import student_balances
+    from preschool.models import Student
+    rows = student_balances(order_by=(Student.class_name, Student.section, Student.name))
+    lines = ['Admission No,Name,Class,Section,Phone,Receivable\n']
+    lines += [f'{s.admission_no or ""},{s.name or ""},{s.class_name or ""},{s.section or ""},'
+              f'{s.phone or ""},{float(bal):.2f}\n' for s, bal in rows]
+    body = ''.join(lines)
+    return len(body.encode()), time.perf_counter()
+
+def main():
+    args = parser(__doc__, students=100000).parse_args()
+    app = make_app(args.db)   # creates the schema; the child fills it
+    child = multiprocessing.Process(target=_seed, args=(app.bench_db, args.students))
+    child.start()
+    child.join()
+    app = make_app(app.bench_db, fresh=False)
+    client = login(app)
+    client.get('/reports/income.csv')   # warm imports and templates
+
+    # streaming first: ru_maxrss only ever grows
+    for label, run in (('streamed', lambda: streamed(client)), ('in memory', in_memory)):
+        base, start = _rss_mb(), time.perf_counter()
+        with app.app_context():
+            size, first_byte = run()
+        total = time.perf_counter() - start
+        print(f'{args.students} students  {label:9}  {size / 1e6:5.1f} MB  first byte {(first_byte - start) * 1000:6.0f} ms  '
+              f'total {total * 1000:6.0f} ms  peak RSS +{_rss_mb() - base:6.1f} MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+# scripts/bench/bench_search.py
+"""
+Student search: the FTS5 index (search_students) against the old
+'%q%' LIKE scan over name, admission no, parent name and phone.
+
+    python scripts/bench/bench_search.py --students 10000
+"""
+from common import parser, make_app, seed, timed
+
+QUERIES = ['shah', 'A0123', '98000012', 'parent 77']
+REPEAT = 20
+
+def like_scan(q):
+    from sqlalchemy import or_
+    from preschool.models import Student
+    pattern = f'%{q}%'
+    return (Student.query.filter(or_(Student.name.ilike(pattern), Student.admission_no.ilike(pattern),
+                                     Student.parent_name.ilike(pattern), Student.phone.ilike(pattern)))
+            .order_by(Student.name).limit(20).all())
+
+def main():
+    args = parser(__doc__, students=10000).parse_args()
+    app = seed(make_app(args.db), args.students)
+    from preschool.search import search_students
+    with app.app_context():
+        for q in QUERIES:
+            for label, fn in (('like', like_scan), ('fts', search_students)):
+                fn(q)   # warm the page cache
+                rows, ms = timed(lambda: fn(q), REPEAT)
+                print(f'{args.students} students  {label:4} {q!r:12} {len(rows):3d} rows {ms:8.2f} ms')
+
+if __name__ == '__main__':
+    main()
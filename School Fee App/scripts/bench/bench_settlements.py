@@ -0,0 +1,101 @@
+# scripts/bench/bench_settlements.py
+"""
+Bank statement import and settlement matching: POST /recon/bank-import on a
+year of daily UPI batches plus noise credits, then find_matches() against
+the old nested loop over every batch x every credit on the same inputs.
+
+3% of the batches never settle and 5% settle 0.40 off; settlements land
+one to three days after the batch.
+
+    python scripts/bench/bench_settlements.py --noise 20000
+"""
+import io
+import random
+from datetime import date, timedelta
+from decimal import Decimal as D
+from common import parser, make_app, login, QueryCounter, timed
+
+DAYS = 365
+START = date(2025, 4, 1)
+
+def seed_batches(app, rnd):
+    """One batch per day; returns the statement CSV and the utr -> batch id truth."""
+    from preschool.extensions import db
+    from preschool.models import SettlementBatch
+    batches = []
+    for i in range(DAYS):
+        day = START + timedelta(days=i)
+        expected = D(rnd.randint(2000, 90000)) + D(rnd.randint(0, 99)) / 100
+        batches.append(dict(provider='UPI', start_date=day, end_date=day, days_grouping=1, gross=expected,
+                            charges=0, expected_net=expected, bank_net=0, variance=0, status='Open'))
+    with app.app_context():
+        db.session.execute(SettlementBatch.__table__.insert(), batches)
+        db.session.commit()
+        ids = [bid for (bid,) in db.session.query(SettlementBatch.id).order_by(SettlementBatch.id)]
+    lines, truth = [], {}
+    for bid, b in zip(ids, batches):
+        r = rnd.random()
+        if r < 0.03:
+            continue
+        utr = f'UPI{bid:08d}'
+        truth[utr] = bid
+        amount = b['expected_net'] + (D('0.40') if r < 0.08 else 0)
+        lines.append(f"{b['end_date'] + timedelta(days=rnd.choice([1, 1, 1, 2, 3]))},{amount},{utr}")
+    return lines, truth
+
+def nested_loop(credits, batches):
+    """The pre-index matcher: scan every credit for every batch."""
+    from preschool.settlements import MATCH_DAYS, MATCH_AMOUNT
+    used, pairs = set(), []
+    for bid, start, end, expected in sorted(batches, key=lambda b: (b[2], b[0])):
+        best = None
+        for cid, day, amount in credits:
+            if cid in used or not (start <= day <= end + timedelta(days=MATCH_DAYS)) \
+                    or abs(amount - expected) > MATCH_AMOUNT:
+                continue
+            key = (abs(amount - expected), abs((day - end).days), cid)
+            if best is None or key < best:
+                best = key
+        if best:
+            used.add(best[-1])
+            pairs.append((bid, best[-1]))
+    return pairs
+
+def main():
+    p = parser(__doc__)
+    p.add_argument('--noise', type=int, default=20000, help='unrelated credits on the statement')
+    args = p.parse_args()
+    rnd = random.Random(3)
+    app = make_app(args.db)
+    lines, truth = seed_batches(app, rnd)
+    lines += [f'{START + timedelta(days=rnd.randint(0, DAYS + 5))},{rnd.randint(100, 90000)}.{rnd.randint(0, 99):02d},'
+              f'NEFT{k:09d}' for k in range(args.noise)]
+    rnd.shuffle(lines)
+    data = ('date,amount_net,utr\n' + '\n'.join(lines) + '\n').encode()
+    counter = QueryCounter(app)
+    client = login(app)
+
+    counter.count = 0
+    response, ms = timed(lambda: client.post('/recon/bank-import', data={'csv': (io.BytesIO(data), 'stmt.csv')},
+                                             content_type='multipart/form-data'))
+    assert response.status_code in (200, 302), response.status_code
+    from preschool.extensions import db
+    from preschool.models import BankCredit, SettlementBatch
+    from preschool.settlements import find_matches
+    with app.app_context():
+        got = dict(db.session.query(BankCredit.utr, BankCredit.batch_id).filter(BankCredit.batch_id.isnot(None)))
+        correct = sum(1 for utr, bid in truth.items() if got.get(utr) == bid)
+        print(f'{len(lines)} lines  /recon/bank-import {counter.count:5d} statements {ms:8.0f} ms  '
+              f'({correct} of {len(truth)} batches matched correctly, '
+              f'{sum(1 for u, b in got.items() if truth.get(u) != b)} wrong)')
+
+        credits = db.session.query(BankCredit.id, BankCredit.date, BankCredit.amount_net).all()
+        batches = db.session.query(SettlementBatch.id, SettlementBatch.start_date, SettlementBatch.end_date,
+                                   SettlementBatch.expected_net).all()
+        fast, fast_ms = timed(lambda: find_matches(credits, batches))
+        slow, slow_ms = timed(lambda: nested_loop(credits, batches))
+        print(f'{len(credits)} credits x {len(batches)} batches  find_matches {fast_ms:8.1f} ms  '
+              f'nested loop {slow_ms:8.0f} ms  same pairs: {list(fast) == slow}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# scripts/bench/common.py
+"""
+Shared helpers for the benchmark scripts in this folder.
+
+Every benchmark works on its own throwaway SQLite file (a temp dir unless
+--db is given), never on instance/app.db: DATABASE_URL is set before
+config.py is imported and checked afterwards.
+
+    python scripts/bench/bench_balances.py --students 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[2]
+
+def parser(description, **defaults):
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--db', help='SQLite file to (re)create; default: a temp file')
+    p.add_argument('--students', type=int, default=defaults.get('students', 2000))
+    return p
+
+def make_app(path=None, fresh=True, **config):
+    """create_app() on a benchmark database. Extra keyword arguments override Config."""
+    path = os.path.abspath(path or os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db'))
+    if fresh:
+        for ext in ('', '-wal', '-shm'):
+            if os.path.exists(path + ext):
+                os.remove(path + ext)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('BACKUP_INTERVAL_HOURS', '0')
+    sys.path.insert(0, str(APP_DIR))
+    os.chdir(APP_DIR)
+    import config as app_config
+    app_config.Config.SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
+    app_config.Config.BACKUP_FOLDER = os.path.join(os.path.dirname(path), 'backups')
+    app_config.Config.BACKUP_INTERVAL_HOURS = 0
+    for key, value in config.items():
+        setattr(app_config.Config, key, value)
+    from preschool import create_app
+    app = create_app()
+    assert app.config['SQLALCHEMY_DATABASE_URI'].endswith(path)
+    app.bench_db = path
+    return app
+
+def seed(app, n, receipts_per_student=1, seed_value=1):
+    """n students in 5 classes with two fees each and receipts with one item;
+    every 17th student is discontinued (every 34th collectible)."""
+    from preschool.extensions import db
+    from preschool.models import Student, FeeType, StudentFee, Receipt, ReceiptItem
+    from preschool.ledger import rebuild_balances
+    from preschool.rollups import rebuild_rollups
+
+    rnd = random.Random(seed_value)
+    with app.app_context():
+        types = [FeeType(name=f'Fee{i}') for i in range(3)]
+        db.session.add_all(types)
+        db.session.flush()
+        db.session.execute(Student.__table__.insert(), [dict(
+            admission_no=f'A{i:05d}', name=f"Kid {i} {rnd.choice(['Rao', 'Shah', 'Iyer', 'Khan'])}",
+            class_name=f'C{i % 5}', section='AB'[i % 2], parent_name=f'Parent {i}', phone=f'98{i:08d}',
+            discontinued=date(2025, 1, 1) if i % 17 == 0 else None, collectible=(i % 34 == 0),
+            created_at=datetime(2025, 1, 1)) for i in range(n)])
+        ids = [r for (r,) in db.session.query(Student.id).order_by(Student.id)]
+        db.session.execute(StudentFee.__table__.insert(), [
+            dict(student_id=s, fee_type_id=types[j].id, amount=1000 * (j + 1)) for s in ids for j in range(2)])
+        base = datetime(2025, 6, 1)
+        db.session.execute(Receipt.__table__.insert(), [
+            dict(receipt_no=f'R{k}-{s}', student_id=s, amount=500, mode=rnd.choice(['Cash', 'UPI']),
+                 created_at=base + timedelta(hours=(k * len(ids) + i) % 2000), created_by='bench')
+            for k in range(receipts_per_student) for i, s in enumerate(ids)])
+        db.session.execute(ReceiptItem.__table__.insert(), [
+            dict(receipt_id=r, fee_type_id=types[0].id, amount=500)
+            for (r,) in db.session.query(Receipt.id)])
+        db.session.commit()
+        rebuild_balances()
+        rebuild_rollups()
+        db.session.commit()
+    return app
+
+def login(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'owner', 'password': 'owner123'})
+    return client
+
+class QueryCounter:
+    """Counts statements run on the app's engine."""
+
+    def __init__(self, app):
+        from sqlalchemy import event
+        from preschool.extensions import db
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+def timed(fn, repeat=1):
+    """(last result, average ms) of calling fn() `repeat` times."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
@@ -1,5 +1,10 @@
 // static/app.js
 (() => {
+  const escapeHtml = (v) =>
+    String(v ?? "").replace(/[&<>"']/g, (c) => ({
+      "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;",
+    })[c]);
+
   const onReady = (fn) =>
     document.readyState !== "loading"
       ? fn()
@@ -8,7 +13,7 @@
   onReady(() => {
     // ADDED: Initialize DataTables on any table with the .datatable class
     if (typeof $ !== 'undefined' && $.fn.DataTable) {
-      $('.datatable').DataTable({
+      $('.datatable:not([data-source])').DataTable({
         "pageLength": 25, // Show 25 entries per page by default
         "order": [],      // Disable the default initial sorting
         "language": {
@@ -16,8 +21,165 @@
             "searchPlaceholder": "Search records..."
         }
       });
+      $('.datatable[data-source]').each((_, table) => serverTable(table));
     }
 
+    // ---------------- Server-side tables (opt-in)
+    // <table class="datatable" data-source="/url"> plus <th data-col="key">
+    // headers (optional data-render="money|links", data-orderable="false").
+    // Moving forward page by page reuses the previous page's `next` cursor
+    // (keyset paging); jumps fall back to offsets.
+    function serverTable(table) {
+      const renderers = {
+        money: (v) => `₹ ${escapeHtml(v)}`,
+        links: (v) =>
+          (v || [])
+            .map((l) => `<a class="btn small" href="${escapeHtml(l.url)}">${escapeHtml(l.label)}</a>`)
+            .join(" "),
+      };
+      const columns = Array.from(table.querySelectorAll("thead th")).map((th) => ({
+        data: th.dataset.col,
+        orderable: th.dataset.orderable !== "false",
+        render: (v, type) =>
+          type === "display" ? (renderers[th.dataset.render] || escapeHtml)(v) : v,
+      }));
+      let state = { key: null, cursors: {}, start: 0 };
+      $(table).DataTable({
+        serverSide: true,
+        processing: true,
+        pageLength: 25,
+        order: [],
+        searchDelay: 300,
+        columns,
+        language: { search: "", searchPlaceholder: "Search records..." },
+        ajax: {
+          url: table.dataset.source,
+          data: (d) => {
+            const key = JSON.stringify([d.length, d.order, d.search.value]);
+            if (key !== state.key) state = { key, cursors: {}, start: 0 };
+            state.start = d.start;
+            if (d.start > 0 && state.cursors[d.start]) d.after = state.cursors[d.start];
+          },
+          dataSrc: (json) => {
+            if (json.next) state.cursors[state.start + json.data.length] = json.next;
+            return json.data;
+          },
+        },
+      });
+    }
+
+    // ---------------- Student lookup (opt-in)
+    // <div class="lookup" data-student-lookup="/students/search"> holding a
+    // text input.lookup-input and a hidden input[name=student_id]. Results are
+    // fetched a page at a time as you type; data-lookup-extra="credit" shows
+    // the student's credit next to each name. With data-lookup-multiple="name"
+    // (and a .lookup-chips element) each pick adds a removable chip carrying
+    // a hidden input of that name instead.
+    document.querySelectorAll("[data-student-lookup]").forEach((box) => {
+      const input = box.querySelector(".lookup-input");
+      const multiple = box.dataset.lookupMultiple;
+      const chips = box.querySelector(".lookup-chips");
+      const hidden = multiple ? null : box.querySelector('input[type="hidden"]');
+      const menu = document.createElement("div");
+      menu.className = "lookup-menu";
+      box.appendChild(menu);
+      const extra = box.dataset.lookupExtra;
+      let items = [], active = -1, page = 1, timer = null, seq = 0;
+
+      const close = () => { menu.innerHTML = ""; items = []; active = -1; };
+      const addChip = (row) => {
+        if (chips.querySelector(`input[value="${row.id}"]`)) return;
+        const chip = document.createElement("span");
+        chip.className = "lookup-chip";
+        chip.innerHTML = `${escapeHtml(row.label)} <button type="button" title="Remove">×</button>` +
+          `<input type="hidden" name="${escapeHtml(multiple)}" value="${escapeHtml(row.id)}">`;
+        chip.querySelector("button").addEventListener("click", () => chip.remove());
+        chips.appendChild(chip);
+      };
+      const pick = (row) => {
+        if (multiple) {
+          addChip(row);
+          input.value = "";
+          close();
+          return;
+        }
+        hidden.value = row.id;
+        input.value = row.label;
+        input.setCustomValidity("");
+        close();
+      };
+      const highlight = (i) => {
+        active = i;
+        menu.querySelectorAll(".lookup-item").forEach((el, j) =>
+          el.classList.toggle("active", j === i));
+      };
+      const render = (json, append) => {
+        if (!append) { menu.innerHTML = ""; items = []; }
+        menu.querySelector(".lookup-more")?.remove();
+        json.results.forEach((row) => {
+          const el = document.createElement("div");
+          el.className = "lookup-item";
+          el.innerHTML = escapeHtml(row.label) +
+            (extra && row[extra] !== undefined ? `<small>₹ ${escapeHtml(row[extra])}</small>` : "");
+          el.addEventListener("mousedown", (e) => { e.preventDefault(); pick(row); });
+          menu.appendChild(el);
+          items.push(row);
+        });
+        if (!items.length) menu.innerHTML = '<div class="lookup-empty">No students found</div>';
+        if (json.more) {
+          const more = document.createElement("div");
+          more.className = "lookup-more";
+          more.textContent = "More…";
+          more.addEventListener("mousedown", (e) => { e.preventDefault(); load(page + 1); });
+          menu.appendChild(more);
+        }
+      };
+      const load = (p) => {
+        const url = new URL(box.dataset.studentLookup, location.href);
+        url.searchParams.set("q", input.value.trim());
+        url.searchParams.set("page", p);
+        const mine = ++seq;
+        fetch(url, { headers: { Accept: "application/json" } })
+          .then((r) => r.json())
+          .then((json) => {
+            if (mine !== seq) return; // a newer keystroke won
+            page = p;
+            render(json, p > 1);
+          });
+      };
+
+      input.addEventListener("input", () => {
+        if (hidden) hidden.value = "";
+        input.setCustomValidity("");
+        clearTimeout(timer);
+        timer = setTimeout(() => load(1), 250);
+      });
+      input.addEventListener("focus", () => { if (!hidden || !hidden.value) load(1); });
+      input.addEventListener("blur", () => setTimeout(close, 150));
+      input.addEventListener("keydown", (e) => {
+        if (e.key === "ArrowDown" && items.length) {
+          highlight(Math.min(active + 1, items.length - 1));
+          e.preventDefault();
+        } else if (e.key === "ArrowUp" && items.length) {
+          highlight(Math.max(active - 1, 0));
+          e.preventDefault();
+        } else if (e.key === "Enter" && active >= 0) {
+          pick(items[active]);
+          e.preventDefault();
+        } else if (e.key === "Escape") {
+          close();
+        }
+      });
+      // a typed name that was never picked must not submit
+      box.closest("form")?.addEventListener("submit", (e) => {
+        if (hidden && !hidden.value) {
+          input.setCustomValidity("Pick a student from the list");
+          input.reportValidity();
+          e.preventDefault();
+        }
+      });
+    });
+
     // ---------------- Tabs (data-tab + .tab-content with id="tab-<name>")
     document.querySelectorAll(".tabs").forEach((container) => {
       const tabs = container.querySelectorAll(".tab");
@@ -0,0 +1,78 @@
+# tests/conftest.py
+"""
+Shared fixtures: a fresh file-backed SQLite app per test, a logged-in
+client, and a small seeded school (two classes, fees, receipts with items).
+
+Run from "School Fee App":  python -m pytest -q
+"""
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+import config
+from preschool.extensions import db
+from preschool.cache import _caches, invalidate
+import preschool.search
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(config.Config, 'TESTING', True, raising=False)
+    monkeypatch.setattr(config.Config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(config.Config, 'BACKUP_FOLDER', str(tmp_path / 'backups'))
+    monkeypatch.setattr(config.Config, 'BACKUP_INTERVAL_HOURS', 0)
+    monkeypatch.setattr(config.Config, 'BACKUP_CHANGES_MINUTES', 0)
+    # module-level caches outlive an app; never let one test see another's data
+    invalidate(*list(_caches))
+    preschool.search._fts_ready = None
+
+    from preschool import create_app
+    app = create_app()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'owner', 'password': 'owner123'})
+    return client
+
+@pytest.fixture
+def seeded(app):
+    """Two classes of students with fees, several receipts each with two items."""
+    from preschool.models import Student, FeeType, StudentFee, Receipt, ReceiptItem
+    from preschool.ledger import rebuild_balances
+    from preschool.rollups import rebuild_rollups
+
+    with app.app_context():
+        tuition, transport = FeeType(name='Tuition'), FeeType(name='Transport')
+        db.session.add_all([tuition, transport])
+        students = [Student(admission_no=f'A{i:03d}', name=f'Student {i}', class_name=f'C{i % 2 + 1}',
+                            section='A', phone=f'98000000{i:02d}', created_at=datetime(2025, 4, 1))
+                    for i in range(1, 9)]
+        db.session.add_all(students)
+        db.session.flush()
+        for s in students:
+            db.session.add(StudentFee(student_id=s.id, fee_type_id=tuition.id, amount=5000))
+            db.session.add(StudentFee(student_id=s.id, fee_type_id=transport.id, amount=1500))
+        n = 0
+        for s in students[:6]:
+            for k in range(3):
+                n += 1
+                rec = Receipt(receipt_no=f'T-R-{n:04d}', student_id=s.id, amount=700, mode='Cash',
+                              created_at=datetime(2025, 6, 1) + timedelta(days=n), created_by='owner')
+                rec.items = [ReceiptItem(fee_type_id=tuition.id, amount=500),
+                             ReceiptItem(fee_type_id=transport.id, amount=200)]
+                db.session.add(rec)
+        db.session.commit()
+        rebuild_balances()
+        rebuild_rollups()
+        db.session.commit()
+        return {'student_ids': [s.id for s in students],
+                'receipt_ids': [r for (r,) in db.session.query(Receipt.id).order_by(Receipt.id)],
+                'fee_type_ids': [tuition.id, transport.id]}
@@ -0,0 +1,24 @@
+# tests/test_aging.py
+from datetime import date
+from preschool.aging import COLUMNS, aging_frame, aging_totals
+
+def test_aging_with_no_charges(app, client):
+    # a fresh database: no students, no student_fee rows
+    assert client.get('/reports/aging').status_code == 200
+    assert client.get('/reports/aging.csv').status_code == 200
+    with app.app_context():
+        frame = aging_frame(as_of=date(2025, 7, 1))
+        assert frame.empty
+        assert all(v == 0 for v in aging_totals(frame).values())
+
+def test_aging_for_class_without_charges(seeded, client):
+    assert client.get('/reports/aging?class_name=NoSuchClass').status_code == 200
+    assert client.get('/reports/aging.csv?class_name=NoSuchClass&view=student').status_code == 200
+
+def test_aging_allocates_receipts_oldest_first(seeded, app):
+    with app.app_context():
+        frame = aging_frame(as_of=date(2025, 7, 1))
+        totals = aging_totals(frame)
+    # 8 students x 6500 charged, 6 x 2100 received
+    assert totals['overdue'] == 8 * 6500 - 6 * 2100
+    assert set(COLUMNS) <= set(frame.columns)
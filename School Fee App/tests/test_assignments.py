@@ -0,0 +1,60 @@
+# tests/test_assignments.py
+from datetime import date
+from sqlalchemy import func
+from preschool.extensions import db
+from preschool.models import User, Student, StudentFee, FeePlan, FeePlanInstallment
+from preschool.feeplans import assign_plan
+from preschool.assignments import cohort, preview, assign_fee
+
+TERM_1, TERM_2 = date(2025, 6, 1), date(2025, 10, 1)
+
+def _fees(student_id, fee_type_id):
+    return [(f.due_date, int(f.amount)) for f in
+            StudentFee.query.filter_by(student_id=student_id, fee_type_id=fee_type_id).order_by(StudentFee.id)]
+
+def test_same_fee_type_for_two_terms(app, seeded, client):
+    tuition = seeded['fee_type_ids'][0]
+    sid = seeded['student_ids'][0]
+    with app.app_context():
+        balance = Student.query.get(sid).balance_amount
+        criteria = cohort('C2')
+        # the seeded undated Tuition row does not block a dated term charge
+        assert preview(tuition, *criteria, due_date=TERM_1) == (4, 4)
+        assert assign_fee(tuition, 4000, *criteria, due_date=TERM_1) == 4
+        db.session.commit()
+    for _ in range(2):   # term 2 through the view; the re-run charges nobody
+        client.post('/fees/fees/bulk-assign', data={'fee_type_id': tuition, 'amount': '4000',
+                                                    'class_name': 'C2', 'due_date': TERM_2.isoformat()})
+    with app.app_context():
+        assert _fees(sid, tuition) == [(None, 5000), (TERM_1, 4000), (TERM_2, 4000)]
+        assert Student.query.get(sid).balance_amount == balance + 8000
+        assert db.session.query(func.count(StudentFee.id)).filter_by(due_date=TERM_2).scalar() == 4
+
+def test_plan_installments_do_not_block_assignment(app, seeded):
+    tuition = seeded['fee_type_ids'][0]
+    with app.app_context():
+        plan = FeePlan(name='Tuition terms', fee_type_id=tuition,
+                       installments=[FeePlanInstallment(seq=1, due_date=TERM_1, amount=2000)])
+        db.session.add(plan)
+        db.session.flush()
+        assign_plan(plan, cohort('C1'))
+        # same fee type and due date as the installment, but a separate charge
+        assert assign_fee(tuition, 2500, *cohort('C1'), due_date=TERM_1) == 4
+        assert assign_fee(tuition, 2500, *cohort('C1'), due_date=TERM_1) == 0
+
+def test_only_managers_create_plans(app, seeded, client):
+    form = {'name': 'Tuition terms', 'fee_type_id': seeded['fee_type_ids'][0],
+            'due_1': '2025-06-01', 'amount_1': '2000', 'due_2': '2025-10-01', 'amount_2': '2000'}
+    with app.app_context():
+        cashier = User(username='cashier', role='Cashier')
+        cashier.set_password('cashier123')
+        db.session.add(cashier)
+        db.session.commit()
+    other = app.test_client()
+    other.post('/login', data={'username': 'cashier', 'password': 'cashier123'})
+    assert other.post('/fees/fees/plans/new', data=form).status_code == 302
+    with app.app_context():
+        assert FeePlan.query.count() == 0
+    client.post('/fees/fees/plans/new', data=form)
+    with app.app_context():
+        assert [len(p.installments) for p in FeePlan.query] == [2]
@@ -0,0 +1,13 @@
+# tests/test_backups.py
+import preschool.backups as backups
+import preschool.utils
+
+def test_job_fails_cleanly_when_settings_write_fails(app, monkeypatch):
+    def locked(*args, **kwargs):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(preschool.utils, 'set_setting', locked)
+    monkeypatch.setattr(backups, '_job', {'state': 'queued'})
+    backups._run_job(app)   # what start_backup() runs on its thread
+    status = backups.job_status()
+    # not left 'compressing', which would make start_backup() refuse every later run
+    assert status['state'] == 'failed' and 'locked' in status['error']
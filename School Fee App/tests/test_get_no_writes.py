@@ -0,0 +1,47 @@
+# tests/test_get_no_writes.py
+"""GET pages only read: rendering must not allocate receipt numbers or touch any row."""
+import pytest
+from sqlalchemy import event
+from preschool.extensions import db
+
+PAGES = [
+    '/',
+    '/receipts/',
+    '/receipts/new',
+    '/students/',
+    '/students/data',
+    '/students/search?q=Stud',
+    '/reports/summary',
+    '/reports/overdue',
+    '/reports/aging',
+    '/reports/income',
+    '/reports/discontinued/collectible',
+    '/settings/',
+]
+
+@pytest.fixture
+def writes(app):
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            seen.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(engine, 'before_cursor_execute', record)
+
+@pytest.mark.parametrize('path', PAGES)
+def test_get_makes_no_writes(seeded, client, writes, path):
+    # twice: the first render may fill caches, neither may write
+    for _ in range(2):
+        assert client.get(path).status_code == 200
+    assert writes == []
+
+def test_receipt_form_does_not_reserve_a_number(seeded, client):
+    first = client.get('/receipts/new').data
+    second = client.get('/receipts/new').data
+    assert first == second
@@ -0,0 +1,25 @@
+# tests/test_instrument.py
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from preschool.extensions import db
+
+def _sizes(info):
+    return {k: len(v) for k, v in info.items() if hasattr(v, '__len__')}
+
+def test_failed_statements_leave_no_state_on_the_connection(app):
+    # pooled connections live as long as the process: nothing may pile up on them
+    with app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            before = _sizes(conn.info)
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM no_such_table'))
+            assert conn.execute(text('SELECT 1')).scalar() == 1
+            assert _sizes(conn.info) == before
+
+def test_request_statements_are_counted(client):
+    response = client.get('/receipts/')
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Count']) > 0
@@ -0,0 +1,39 @@
+# tests/test_query_budget.py
+"""The @query_budget views stay within budget, and an N+1 trips it (TESTING=True)."""
+import pytest
+from preschool.models import Receipt
+from preschool.instrument import query_budget, QueryBudgetExceeded
+
+def _count(response):
+    return int(response.headers['X-Query-Count'])
+
+def test_receipt_list_within_budget(seeded, client):
+    r = client.get('/receipts/')
+    assert r.status_code == 200
+    assert b'Student 1' in r.data
+    assert _count(r) <= 4
+
+def test_receipt_print_within_budget(seeded, client):
+    for receipt_id in seeded['receipt_ids'][:3]:
+        r = client.get(f'/receipts/{receipt_id}/print')
+        assert r.status_code == 200
+        assert b'Transport' in r.data
+        assert _count(r) <= 4
+
+def test_student_card_within_budget(seeded, client):
+    for student_id in seeded['student_ids']:
+        r = client.get(f'/students/{student_id}/card')
+        assert r.status_code == 200
+        assert _count(r) <= 6
+
+def test_n_plus_one_trips_budget(app, seeded):
+    @app.route('/_test/lazy-receipts')
+    @query_budget(4)
+    def lazy_receipts():
+        # Receipt.student is lazy here: one extra SELECT per receipt
+        return ', '.join(r.student.name for r in Receipt.query.all())
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'owner', 'password': 'owner123'})
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/_test/lazy-receipts')
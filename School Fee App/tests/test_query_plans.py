@@ -0,0 +1,54 @@
+# tests/test_query_plans.py
+"""The hot receipt / student_fee / student lookups are index searches, not table scans."""
+import re
+from datetime import date, datetime
+import pytest
+from sqlalchemy import select, func, text
+from preschool.extensions import db
+from preschool.models import Student, StudentFee, Receipt, ReceiptItem
+from preschool.dbfix import ensure_schema
+
+DAY = (datetime(2025, 6, 1), datetime(2025, 6, 2))
+
+HOT_QUERIES = {
+    'ix_receipt_student': select(Receipt).where(Receipt.student_id == 1).order_by(Receipt.created_at),
+    'ix_receipt_created': select(Receipt.id).where(Receipt.created_at >= DAY[0], Receipt.created_at < DAY[1]),
+    'ix_receipt_mode_created': select(func.sum(Receipt.amount)).where(
+        Receipt.mode == 'Cash', Receipt.created_at >= DAY[0], Receipt.created_at < DAY[1]),
+    'ix_receipt_item_receipt': select(ReceiptItem).where(ReceiptItem.receipt_id == 1),
+    'ix_student_fee_student': select(func.sum(StudentFee.amount)).where(
+        StudentFee.student_id == 1, StudentFee.fee_type_id == 1),
+    # the range overdue_query() aggregates (fees not yet due)
+    'ix_student_fee_due': select(StudentFee.student_id, StudentFee.amount)
+        .where(StudentFee.due_date > date(2025, 7, 1)),
+    'ix_student_class_section': select(Student.id).where(Student.class_name == 'C1', Student.section == 'A'),
+}
+
+def _plan(stmt):
+    sql = str(stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+def _assert_uses(index, stmt):
+    table = next(iter(stmt.get_final_froms())).name
+    plan = _plan(stmt)
+    assert any(re.match(rf'SEARCH {table} USING (COVERING )?INDEX {index}\b', step) for step in plan), plan
+    assert not any(step.startswith(f'SCAN {table}') for step in plan), plan
+
+@pytest.mark.parametrize('index', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(app, seeded, index):
+    with app.app_context():
+        _assert_uses(index, HOT_QUERIES[index])
+
+def test_ensure_schema_restores_dropped_indexes(app, seeded):
+    # an older database: tables exist but the declared indexes do not
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for index in HOT_QUERIES:
+                conn.execute(text(f'DROP INDEX {index}'))
+        assert any(step.startswith('SCAN receipt') for step in _plan(HOT_QUERIES['ix_receipt_student']))
+        ensure_schema(db)
+        # as after a restart: pysqlite's statement cache would replay the old EXPLAIN
+        db.session.remove()
+        db.engine.dispose()
+        for index, stmt in HOT_QUERIES.items():
+            _assert_uses(index, stmt)
@@ -0,0 +1,56 @@
+# tests/test_receipt_numbers.py
+"""next_receipt_no() under concurrent cashiers on a file-backed database."""
+import threading
+from preschool.extensions import db
+from preschool.models import Receipt
+from preschool.utils import next_receipt_no, peek_receipt_no
+
+THREADS = 8
+PER_THREAD = 25
+
+def _number(receipt_no):
+    return int(receipt_no.rsplit('-', 1)[1])
+
+def test_concurrent_allocation_is_unique_and_gapless(app, seeded):
+    committed, rolled_back, errors = [], [], []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def cashier(k):
+        student_id = seeded['student_ids'][k % len(seeded['student_ids'])]
+        try:
+            with app.app_context():
+                start.wait()
+                for i in range(PER_THREAD):
+                    no = next_receipt_no()
+                    db.session.add(Receipt(receipt_no=no, student_id=student_id, amount=100,
+                                           mode='Cash', created_by=f'cashier{k}'))
+                    db.session.flush()
+                    if i % 4 == 3:
+                        db.session.rollback()   # e.g. a failed save: the number must be handed out again
+                        with lock:
+                            rolled_back.append(no)
+                    else:
+                        db.session.commit()
+                        with lock:
+                            committed.append(no)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=cashier, args=(k,)) for k in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(committed) == len(set(committed))
+    # rolled-back allocations were not consumed: the committed numbers are 1..n with no holes
+    numbers = sorted(_number(no) for no in committed)
+    assert numbers == list(range(1, len(committed) + 1))
+    assert rolled_back
+    with app.app_context():
+        stored = [no for (no,) in db.session.query(Receipt.receipt_no).filter(Receipt.created_by.like('cashier%'))]
+        assert sorted(stored) == sorted(committed)
+        assert _number(peek_receipt_no()) == len(committed) + 1
@@ -0,0 +1,71 @@
+# tests/test_settlements.py
+import io
+from datetime import date
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from preschool.extensions import db
+from preschool.models import SettlementBatch, BankCredit
+
+@pytest.fixture
+def batch_and_credits(app):
+    with app.app_context():
+        batch = SettlementBatch(provider='UPI', start_date=date(2025, 6, 1), end_date=date(2025, 6, 1),
+                                expected_net=1000, status='Open')
+        credits = [BankCredit(date=date(2025, 6, 2), amount_net=600, utr='UTR1'),
+                   BankCredit(date=date(2025, 6, 2), amount_net=400, utr='UTR2')]
+        db.session.add_all([batch, *credits])
+        db.session.commit()
+        return batch.id, [c.id for c in credits]
+
+def _mapped(app):
+    with app.app_context():
+        return {c.id: c.batch_id for c in BankCredit.query}
+
+@pytest.mark.parametrize('bad', [['x'], ['1.5'], ['']])
+def test_map_rejects_malformed_ids(app, client, batch_and_credits, bad):
+    batch_id, _ = batch_and_credits
+    response = client.post(f'/recon/settlements/{batch_id}/map', data={'credit_id': bad})
+    assert response.status_code == 302
+    assert set(_mapped(app).values()) == {None}
+
+def test_map_rejects_missing_ids(app, client, batch_and_credits):
+    batch_id, ids = batch_and_credits
+    client.post(f'/recon/settlements/{batch_id}/map', data={'credit_id': [str(ids[0]), '999']})
+    assert set(_mapped(app).values()) == {None}
+
+def test_map_credits(app, client, batch_and_credits):
+    batch_id, ids = batch_and_credits
+    client.post(f'/recon/settlements/{batch_id}/map', data={'credit_id': [str(i) for i in ids]})
+    assert _mapped(app) == {i: batch_id for i in ids}
+    with app.app_context():
+        batch = db.session.get(SettlementBatch, batch_id)
+        assert (batch.status, batch.bank_net, batch.variance) == ('Matched', 1000, 0)
+
+def test_legacy_duplicate_utrs_are_kept(app, client):
+    from preschool.dbfix import ensure_schema
+    with app.app_context():
+        # a database from before UTRs were unique: no index, no duplicate_of
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP INDEX uq_bank_credit_utr'))
+            conn.execute(text('ALTER TABLE bank_credit DROP COLUMN duplicate_of'))
+            conn.execute(text("INSERT INTO bank_credit (date, amount_net, utr) VALUES "
+                              "('2025-06-02', 600, 'UTR1'), ('2025-06-03', 600, 'UTR1'), "
+                              "('2025-06-04', 700, 'UTR2'), ('2025-06-05', 600, 'UTR1')"))
+        ensure_schema(db)
+        ensure_schema(db)   # idempotent
+        db.session.remove()
+        db.engine.dispose()
+        rows = [(c.id, c.utr, c.duplicate_of) for c in BankCredit.query.order_by(BankCredit.id)]
+        assert rows == [(1, 'UTR1', None), (2, 'UTR1', 1), (3, 'UTR2', None), (4, 'UTR1', 1)]
+        sql = db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'uq_bank_credit_utr'")).scalar()
+        assert sql.endswith('WHERE duplicate_of IS NULL')
+    csv = b'date,amount_net,utr\n2025-06-06,600,UTR1\n2025-06-06,800,UTR3\n'
+    client.post('/recon/bank-import', data={'csv': (io.BytesIO(csv), 's.csv')},
+                content_type='multipart/form-data')
+    with app.app_context():
+        assert BankCredit.query.filter_by(utr='UTR1').count() == 3
+        assert BankCredit.query.filter_by(utr='UTR3').count() == 1
+        with pytest.raises(IntegrityError):
+            db.session.add(BankCredit(date=date(2025, 6, 7), amount_net=1, utr='UTR2'))
+            db.session.commit()